@@ -0,0 +1,462 @@
+"""
+    File name: atdb_backend.py
+    version: 1.0.0 (19 oct 2026)
+    Author: Copyright (C) 2019 - Nico Vermaas - ASTRON
+    Description: data sources for the ATDB statistics
+
+    Every backend offers the same fetch functions:
+    - fetch_dataproduct_sizes(start_date, end_date) : total size of the ARTS and IMAGING dataproducts per day
+    - fetch_task_sizes(taskids)                     : total size of the dataproducts per task
+    - fetch_observations(starttime, endtime)        : the observations of the targets (field_ha IS NULL)
+    - fetch_times(query)                            : the results of the /times endpoint
+
+    A backend raises NotImplementedError for the data that it does not have, and BackendUnavailable
+    when it can not be reached. The ChainBackend then uses the next backend.
+"""
+
+import os
+import json
+import pickle
+import hashlib
+import sqlite3
+import datetime
+import urllib.parse
+
+import requests
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+# The request header
+ATDB_HEADER = {
+    'content-type': "application/json",
+    'cache-control': "no-cache",
+    'authorization': "Basic YWRtaW46YWRtaW4="
+}
+
+# the maximum number of parameters in a single IN (...) clause
+CHUNK_SIZE = 500
+
+# the ARTS ('ARTS190311...') and IMAGING ('WSRTA190311...') dataproducts of a range of days (yymmdd).
+# The filenames start with the day, so the range is a range of filenames: ARTS<first day> <= filename < ARTS<day after>
+DATAPRODUCT_RANGE = (
+    "((filename >= %s AND filename < %s) OR (filename >= %s AND filename < %s))")
+
+# the sizes of the ARTS and IMAGING dataproducts, per mode and day
+DATAPRODUCT_SIZES_QUERY = (
+    "SELECT CASE WHEN filename LIKE 'ARTS%%' THEN 'ARTS' ELSE 'IMAGING' END, "
+    "CASE WHEN filename LIKE 'ARTS%%' THEN substr(filename, 5, 6) ELSE substr(filename, 6, 6) END, "
+    "sum(size) FROM taskdatabase_dataproduct "
+    "WHERE " + DATAPRODUCT_RANGE + " "
+    "GROUP BY 1, 2")
+
+DATAPRODUCTS_QUERY = (
+    'SELECT "taskID", filename, size FROM taskdatabase_dataproduct '
+    "WHERE " + DATAPRODUCT_RANGE)
+
+OBSERVATIONS_QUERY = (
+    "SELECT field_ra, field_dec, field_name, starttime, endtime FROM taskdatabase_observation "
+    "WHERE starttime > %s AND endtime < %s AND field_ha IS NULL")
+
+TASK_SIZES_QUERY = (
+    'SELECT "taskID", sum(size) FROM taskdatabase_dataproduct '
+    'WHERE "taskID" IN ({}) GROUP BY "taskID"')
+
+
+class BackendUnavailable(Exception):
+    """
+    The backend can not be used right now, like when its driver is not installed or its server is down.
+    """
+    pass
+
+
+class Backend:
+    """
+    The interface of the data sources
+    """
+    name = 'backend'
+
+    def fetch_dataproduct_sizes(self, start_date, end_date):
+        """
+        :return: dict with date : {'ARTS': size in bytes, 'IMAGING': size in bytes}, only for the days with data
+        """
+        raise NotImplementedError(self.name + ' has no dataproduct sizes')
+
+    def fetch_task_sizes(self, taskids):
+        """
+        :return: dict with taskID : size in bytes
+        """
+        raise NotImplementedError(self.name + ' has no task sizes')
+
+    def fetch_observations(self, starttime, endtime):
+        """
+        :return: list of dicts with field_ra, field_dec, field_name, starttime and endtime
+        """
+        raise NotImplementedError(self.name + ' has no observations')
+
+    def fetch_times(self, query):
+        """
+        :return: iterable of the results of the /times endpoint
+        """
+        raise NotImplementedError(self.name + ' has no times')
+
+
+class SqlBackend(Backend):
+    """
+    The queries on the ATDB tables, shared by PostgreSQL and SQLite.
+    The queries are written with %s placeholders, which are replaced for databases with another paramstyle.
+    """
+    placeholder = '%s'
+
+    def connect(self):
+        raise NotImplementedError
+
+    def execute(self, query, params=()):
+        # the '%%' of a LIKE is only unescaped by a %s paramstyle database when there are parameters
+        if self.placeholder != '%s':
+            query = query.replace('%%', '%').replace('%s', self.placeholder)
+        elif len(params) == 0:
+            query = query.replace('%%', '%')
+
+        connection = self.connect()
+        try:
+            cursor = connection.cursor()
+            if len(params) == 0:
+                cursor.execute(query)
+            else:
+                cursor.execute(query, params)
+            records = cursor.fetchall()
+            cursor.close()
+        finally:
+            connection.close()
+        return records
+
+    def dataproduct_range(self, start_date, end_date):
+        first_day = start_date.strftime('%y%m%d')
+        day_after = (end_date + datetime.timedelta(days=1)).strftime('%y%m%d')
+        return ('ARTS' + first_day, 'ARTS' + day_after, 'WSRTA' + first_day, 'WSRTA' + day_after)
+
+    def fetch_dataproduct_sizes(self, start_date, end_date):
+        sizes = {}
+        for mode, day, size in self.execute(DATAPRODUCT_SIZES_QUERY, self.dataproduct_range(start_date, end_date)):
+            if size is None:
+                continue
+            try:
+                date = datetime.datetime.strptime(day, '%y%m%d')
+            except ValueError:
+                continue
+            sizes.setdefault(date, {'ARTS': 0, 'IMAGING': 0})[mode] = float(size)
+
+        return sizes
+
+    def fetch_dataproducts(self, start_date, end_date):
+        """
+        :return: the ARTS and IMAGING dataproducts of a range of days, as (taskID, filename, size) tuples
+        """
+        return self.execute(DATAPRODUCTS_QUERY, self.dataproduct_range(start_date, end_date))
+
+    def fetch_task_sizes(self, taskids):
+        sizes = {}
+        taskids = list(taskids)
+        for i in range(0, len(taskids), CHUNK_SIZE):
+            chunk = taskids[i:i + CHUNK_SIZE]
+            query = TASK_SIZES_QUERY.format(','.join(['%s'] * len(chunk)))
+            for taskid, size in self.execute(query, tuple(chunk)):
+                if size is not None:
+                    sizes[taskid] = float(size)
+        return sizes
+
+    def fetch_observations(self, starttime, endtime):
+        observations = []
+        for record in self.execute(OBSERVATIONS_QUERY, (starttime, endtime)):
+            observations.append({'field_ra': record[0],
+                                 'field_dec': record[1],
+                                 'field_name': record[2],
+                                 'starttime': record[3],
+                                 'endtime': record[4]})
+        return observations
+
+
+class PostgresBackend(SqlBackend):
+    """
+    The ATDB database
+    """
+    name = 'postgres'
+
+    def __init__(self, host, port, database, user, password):
+        self.connection_parameters = dict(host=host, port=port, database=database, user=user, password=password)
+
+    def connect(self):
+        if psycopg2 is None:
+            raise BackendUnavailable("psycopg2 is not installed")
+        try:
+            return psycopg2.connect(**self.connection_parameters)
+        except psycopg2.OperationalError as error:
+            raise BackendUnavailable("can not connect to " + str(self.connection_parameters['host']) + ": " + str(error).strip())
+
+
+class SQLiteBackend(SqlBackend):
+    """
+    A local stand-in for the ATDB database and the /times endpoint, to work offline.
+    Use create_fixture to make an empty fixture with the same tables.
+    """
+    name = 'sqlite'
+    placeholder = '?'
+
+    def __init__(self, filename):
+        if not os.path.exists(filename):
+            raise BackendUnavailable("Can not find fixture " + filename)
+        self.filename = filename
+
+    def connect(self):
+        return sqlite3.connect(self.filename, detect_types=sqlite3.PARSE_DECLTYPES)
+
+    def fetch_times(self, query):
+        results = [json.loads(record[0]) for record in self.execute("SELECT result FROM times")]
+        return filter_results(results, query)
+
+
+class RestBackend(Backend):
+    """
+    The ATDB ReST API
+    """
+    name = 'rest'
+
+    def __init__(self, atdb_host):
+        self.atdb_host = atdb_host
+
+    def fetch_times(self, query):
+        """
+        Generator that yields the results of the /times endpoint one by one.
+        The paginated response is followed page by page, so that the results never have to be in memory at once.
+        """
+        if self.atdb_host is None:
+            raise BackendUnavailable("no atdb_host given")
+
+        url = self.atdb_host + "/times?" + str(query)
+
+        while url is not None:
+            # do the request to the ATDB backend
+            print('request to '+url)
+            try:
+                response = requests.request("GET", url, headers=ATDB_HEADER)
+            except requests.exceptions.ConnectionError as error:
+                raise BackendUnavailable("can not connect to " + self.atdb_host + ": " + str(error))
+
+            # parse the response
+            try:
+                json_response = json.loads(response.text)
+                results = json_response["results"]
+
+            except Exception as err:
+                print("Exception : " + str(err))
+                raise (Exception(
+                    "ERROR: " + str(response.status_code) + ", " + str(response.reason) + ', ' + str(response.content)))
+
+            for result in results:
+                yield result
+
+            url = json_response.get("next")
+
+
+class CachedBackend(Backend):
+    """
+    Keeps the results of another backend in cache_dir, the same fetch with the same parameters is read from there.
+    """
+
+    def __init__(self, backend, cache_dir):
+        self.backend = backend
+        self.cache_dir = cache_dir
+        self.name = 'cached ' + backend.name
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def cached(self, function, *params):
+        key = hashlib.sha1(repr((self.backend.name, function, params)).encode()).hexdigest()
+        filename = os.path.join(self.cache_dir, function + '_' + key + '.pickle')
+
+        if os.path.exists(filename):
+            print('read from cache ' + filename)
+            with open(filename, 'rb') as f:
+                return pickle.load(f)
+
+        result = getattr(self.backend, function)(*params)
+        if function == 'fetch_times':
+            result = list(result)
+
+        with open(filename, 'wb') as f:
+            pickle.dump(result, f)
+        return result
+
+    def fetch_dataproduct_sizes(self, start_date, end_date):
+        return self.cached('fetch_dataproduct_sizes', start_date, end_date)
+
+    def fetch_task_sizes(self, taskids):
+        return self.cached('fetch_task_sizes', tuple(sorted(taskids)))
+
+    def fetch_observations(self, starttime, endtime):
+        return self.cached('fetch_observations', starttime, endtime)
+
+    def fetch_times(self, query):
+        return self.cached('fetch_times', query)
+
+
+class ChainBackend(Backend):
+    """
+    Uses per fetch the first backend that has the data
+    """
+
+    def __init__(self, backends):
+        self.backends = backends
+        self.name = ', '.join([backend.name for backend in backends])
+
+    def first(self, function, *params):
+        for backend in self.backends:
+            try:
+                result = getattr(backend, function)(*params)
+                if function == 'fetch_times':
+                    # a generator only raises on its first result
+                    result = iter(result)
+                    first_result = next(result, None)
+                    return _prepend(first_result, result)
+                return result
+            except NotImplementedError:
+                # this backend does not have this data, which is the normal routing
+                continue
+            except BackendUnavailable as error:
+                print(str(error) + ', trying the next backend.')
+
+        raise (Exception("ERROR: no backend (" + self.name + ") can do " + function))
+
+    def fetch_dataproduct_sizes(self, start_date, end_date):
+        return self.first('fetch_dataproduct_sizes', start_date, end_date)
+
+    def fetch_task_sizes(self, taskids):
+        return self.first('fetch_task_sizes', taskids)
+
+    def fetch_observations(self, starttime, endtime):
+        return self.first('fetch_observations', starttime, endtime)
+
+    def fetch_times(self, query):
+        return self.first('fetch_times', query)
+
+
+def _prepend(first_result, results):
+    if first_result is None:
+        return
+    yield first_result
+    for result in results:
+        yield result
+
+
+def filter_results(results, query):
+    """
+    Apply a /times query like 'starttime__gt=2019-06-08T00:00:00Z&taskID__contains=190608' to a list of results.
+    Supports the exact, __gt, __gte, __lt, __lte and __contains lookups.
+    """
+    filters = urllib.parse.parse_qsl(str(query or ''))
+
+    def matches(result):
+        for key, value in filters:
+            field, _, lookup = key.partition('__')
+            if field not in result or result[field] is None:
+                return False
+
+            field_value = result[field]
+            if isinstance(field_value, (int, float)) and not isinstance(field_value, bool):
+                value = type(field_value)(value)
+
+            if lookup == '' and not field_value == value: return False
+            if lookup == 'gt' and not field_value > value: return False
+            if lookup == 'gte' and not field_value >= value: return False
+            if lookup == 'lt' and not field_value < value: return False
+            if lookup == 'lte' and not field_value <= value: return False
+            if lookup == 'contains' and str(value) not in str(field_value): return False
+        return True
+
+    return [result for result in results if matches(result)]
+
+
+def create_fixture(filename):
+    """
+    Create an empty SQLite fixture with the tables that the SQLiteBackend reads.
+    The times table holds the /times results as json.
+    """
+    connection = sqlite3.connect(filename)
+    connection.executescript('''
+        CREATE TABLE IF NOT EXISTS taskdatabase_dataproduct (
+            "taskID" TEXT, filename TEXT, size INTEGER);
+        CREATE TABLE IF NOT EXISTS taskdatabase_observation (
+            "taskID" TEXT, field_name TEXT, field_ra REAL, field_dec REAL, field_ha REAL,
+            starttime TIMESTAMP, endtime TIMESTAMP);
+        CREATE TABLE IF NOT EXISTS times (
+            result TEXT);
+    ''')
+    connection.commit()
+    connection.close()
+
+
+def fill_fixture(filename, dataproducts=(), observations=(), times=()):
+    """
+    Add data to a fixture, the fixture is created when it does not exist yet.
+    :param dataproducts: (taskID, filename, size) tuples
+    :param observations: dicts like the ones returned by fetch_observations
+    :param times: results of the /times endpoint
+    """
+    create_fixture(filename)
+    connection = sqlite3.connect(filename)
+    connection.executemany('INSERT INTO taskdatabase_dataproduct ("taskID", filename, size) VALUES (?,?,?)',
+                           [tuple(dataproduct) for dataproduct in dataproducts])
+    connection.executemany('INSERT INTO taskdatabase_observation (field_name, field_ra, field_dec, starttime, endtime) '
+                           'VALUES (?,?,?,?,?)',
+                           [(observation['field_name'], observation['field_ra'], observation['field_dec'],
+                             observation['starttime'], observation['endtime']) for observation in observations])
+    connection.executemany('INSERT INTO times (result) VALUES (?)',
+                           [(json.dumps(result),) for result in times])
+    connection.commit()
+    connection.close()
+
+
+def record_fixture(args, filename, starttime, endtime):
+    """
+    Fill a fixture with the dataproducts and observations between starttime and endtime from the ATDB database,
+    and with the results of args.query from the /times endpoint of the ReST API.
+    """
+    database = PostgresBackend(args.atdb_database_host,
+                               args.atdb_database_port,
+                               args.atdb_database_name,
+                               args.atdb_database_user,
+                               args.atdb_database_password)
+
+    dataproducts = database.fetch_dataproducts(starttime, endtime)
+    observations = database.fetch_observations(starttime, endtime)
+    times = []
+    if args.query != None:
+        times = list(RestBackend(args.atdb_host).fetch_times(args.query))
+
+    fill_fixture(filename, dataproducts, observations, times)
+    print('fixture ' + filename + ': ' + str(len(dataproducts)) + ' dataproducts, ' +
+          str(len(observations)) + ' observations, ' + str(len(times)) + ' times.')
+
+
+def get_backend(args, cache=True):
+    """
+    Create the backend from the arguments.
+    With a fixture only the (local) fixture is used, otherwise the database and then the ReST API.
+    :param cache: use the cache_dir (if given), switch off for data that changes, like in follow mode.
+    """
+    if args.fixture != None:
+        backend = SQLiteBackend(args.fixture)
+    else:
+        backend = ChainBackend([PostgresBackend(args.atdb_database_host,
+                                                args.atdb_database_port,
+                                                args.atdb_database_name,
+                                                args.atdb_database_user,
+                                                args.atdb_database_password),
+                                RestBackend(args.atdb_host)])
+
+    if cache and args.cache_dir != None:
+        backend = CachedBackend(backend, args.cache_dir)
+
+    return backend
@@ -0,0 +1,108 @@
+"""
+    File name: atdb_export.py
+    version: 1.0.0 (19 oct 2026)
+    Author: Copyright (C) 2019 - Nico Vermaas - ASTRON
+    Description: export the series behind the presentations to columnar files
+
+    The format is determined by the extension of the filename:
+    - .parquet         : Parquet (requires pyarrow)
+    - .arrow, .feather : Arrow IPC file format, which can be memory mapped (requires pyarrow)
+    - .csv             : CSV, written row by row
+"""
+
+import os
+import csv
+import datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pa = None
+
+
+def _require_pyarrow(filename):
+    if pa is None:
+        raise (Exception("ERROR: pyarrow is needed to export to " + filename + ", install it with 'pip install pyarrow'"))
+
+
+def datapoints_to_columns(datapoints, fields):
+    """
+    Convert a list of dicts (like the speed datapoints) into columns
+    :param datapoints: list of dicts
+    :param fields: the keys to export, missing values become None
+    :return: dict with field : list of values
+    """
+    columns = {}
+    for field in fields:
+        columns[field] = [datapoint.get(field) for datapoint in datapoints]
+    return columns
+
+
+def _to_table(columns, types):
+    arrays = {}
+    for name, values in columns.items():
+        arrow_type = pa.type_for_alias(types[name]) if name in types else None
+        arrays[name] = pa.array(values, type=arrow_type)
+    return pa.table(arrays)
+
+
+def export_series(filename, columns, types=None):
+    """
+    Write the columns to filename, the format is determined by the extension.
+    :param filename: output file, like output/ingest_sizes.parquet
+    :param columns: dict with column name : list of values, all lists must have the same length
+    :param types: dict with column name : Arrow type name (like 'int64' or 'timestamp[us]') for the Parquet and
+                  Arrow formats. The type of the other columns is inferred from the values, which gives the null
+                  type for a column that only holds None values.
+    :return:
+    """
+    if types is None:
+        types = {}
+
+    extension = os.path.splitext(filename)[1].lower()
+    print('export to ' + filename)
+
+    if extension == '.csv':
+        with open(filename, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(list(columns.keys()))
+            for row in zip(*columns.values()):
+                writer.writerow([value.isoformat() if isinstance(value, datetime.datetime) else value
+                                 for value in row])
+
+    elif extension == '.parquet':
+        _require_pyarrow(filename)
+        pyarrow.parquet.write_table(_to_table(columns, types), filename)
+
+    elif extension in ['.arrow', '.feather']:
+        _require_pyarrow(filename)
+        table = _to_table(columns, types)
+        with pa.OSFile(filename, 'wb') as sink:
+            with pyarrow.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+    else:
+        raise (Exception("ERROR: unknown export format " + extension + ", use .parquet, .arrow, .feather or .csv"))
+
+
+def read_series(filename):
+    """
+    Read an exported Parquet or Arrow file as a pyarrow Table.
+    Arrow IPC files are memory mapped, so the columns are not copied into memory.
+    :param filename: file written by export_series
+    :return: pyarrow.Table
+    """
+    _require_pyarrow(filename)
+    extension = os.path.splitext(filename)[1].lower()
+
+    if extension == '.parquet':
+        return pyarrow.parquet.read_table(filename, memory_map=True)
+
+    elif extension in ['.arrow', '.feather']:
+        source = pa.memory_map(filename, 'r')
+        return pyarrow.ipc.open_file(source).read_all()
+
+    else:
+        raise (Exception("ERROR: can not read " + extension + " as a table, use .parquet, .arrow or .feather"))
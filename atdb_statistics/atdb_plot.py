@@ -5,6 +5,11 @@
     Description: atdb plot module
 """
 
+import os
+import gzip
+import decimal
+import datetime
+
 import plotly
 import plotly.graph_objs as go
 
@@ -12,9 +17,119 @@ import plotly.graph_objs as go
 import matplotlib.pyplot as plt
 from matplotlib.path import Path
 import matplotlib.patches as patches
+import matplotlib.dates as mdates
 
 import numpy as np
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# options for writing the html output, see set_output_options
+output_options = {
+    'precision': None,
+    'include_plotlyjs': True,
+    'compress': [],
+    'size_budget': None,
+}
+
+# --- output functions ---
+
+def set_output_options(precision=None, include_plotlyjs=True, compress=None, size_budget=None):
+    """
+    :param precision: number of significant digits of the floats in the figure, None keeps them as they are
+    :param include_plotlyjs: True (inline), 'cdn' or 'directory' (a shared plotly.min.js next to the html)
+    :param compress: list of precompressed variants to write next to the html. Possible options: gzip, br
+    :param size_budget: maximum size in bytes of the (smallest) served variant, a warning is given above it
+    """
+    output_options['precision'] = precision
+    output_options['include_plotlyjs'] = include_plotlyjs
+    output_options['compress'] = compress or []
+    output_options['size_budget'] = size_budget
+
+
+def compact_values(value, precision):
+    """
+    Recursively trim the floats to 'precision' significant digits and write datetimes as short strings,
+    so that the figure json gets smaller.
+    """
+    if isinstance(value, dict):
+        return {key: compact_values(v, precision) for key, v in value.items()}
+    if hasattr(value, 'tolist'):
+        value = value.tolist()
+    if isinstance(value, (list, tuple)):
+        return [compact_values(v, precision) for v in value]
+    if isinstance(value, datetime.datetime):
+        if value.time() == datetime.time(0, 0):
+            return value.strftime('%Y-%m-%d')
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, (float, decimal.Decimal)):
+        return float('%.*g' % (precision, value))
+    return value
+
+
+def compress_file(filename, methods):
+    """
+    Write precompressed variants of a file, like index.html.gz and index.html.br
+    :return: list of the written files
+    """
+    with open(filename, 'rb') as f:
+        content = f.read()
+
+    written = []
+    for method in methods:
+        if method == 'gzip':
+            with gzip.open(filename + '.gz', 'wb', compresslevel=9) as f:
+                f.write(content)
+            written.append(filename + '.gz')
+
+        elif method == 'br':
+            if brotli is None:
+                print('WARNING: brotli is not installed, ' + filename + '.br is not written')
+                continue
+            with open(filename + '.br', 'wb') as f:
+                f.write(brotli.compress(content, quality=11))
+            written.append(filename + '.br')
+
+    return written
+
+
+def check_size_budget(filenames, size_budget):
+    """
+    Report the sizes of the files, and warn when even the smallest variant is over the size budget
+    """
+    sizes = {}
+    for filename in filenames:
+        sizes[filename] = os.path.getsize(filename)
+        print(filename + ': ' + str(int(sizes[filename] / 1024)) + ' KB')
+
+    if size_budget is not None and min(sizes.values()) > size_budget:
+        print('WARNING: ' + filenames[0] + ' is over the size budget of ' + str(int(size_budget / 1024)) + ' KB')
+
+
+def write_html(fig, output_html):
+    """
+    Write a plotly figure as html, with the output_options.
+    """
+    if output_options['precision'] is not None:
+        fig = go.Figure(compact_values(fig.to_dict(), output_options['precision']))
+
+    plotly.offline.plot(fig, filename=output_html, include_plotlyjs=output_options['include_plotlyjs'])
+
+    written = [output_html] + compress_file(output_html, output_options['compress'])
+    check_size_budget(written, output_options['size_budget'])
+
+    # the shared plotly.min.js only needs to be compressed again when it has changed
+    if output_options['include_plotlyjs'] == 'directory':
+        plotlyjs = os.path.join(os.path.dirname(output_html), 'plotly.min.js')
+        methods = [method for method, extension in [('gzip', '.gz'), ('br', '.br')]
+                   if method in output_options['compress'] and
+                   (not os.path.exists(plotlyjs + extension) or
+                    os.path.getmtime(plotlyjs + extension) < os.path.getmtime(plotlyjs))]
+        compress_file(plotlyjs, methods)
+
+
 # --- plot functions  ---
 
 def do_mathlib_plot():
@@ -72,28 +187,54 @@ def do_electricity_plots(title, xx,yy, legends, type, output_html,y_axis_title='
     data = [bar_totals,line_consumption,line_redelivery]
 
     fig = go.Figure(data=data, layout=layout)
-    plotly.offline.plot(fig,filename=output_html)
+    write_html(fig, output_html)
 
 
-def do_plot(plot_engine, title, x,y, plot_type, color, output_html,y_axis_title='y-axis'):
+def do_plot(plot_engine, title, xx,yy, plot_type, colors, output_html,y_axis_title='y-axis', legends=None):
     """
 
     :param title: Title of Plot
-    :param x: dict with data for x-axis (time)
-    :param y: dict with data for y_axix (usage)
+    :param xx: list with per series the data for x-axis (time)
+    :param yy: list with per series the data for y_axis (usage)
+    :param colors: list with per series the color
+    :param legends: list with per series the name, or None for a single unnamed series
     :return:
     """
     print('do_plot()')
 
+    if legends is None:
+        legends = [None] * len(xx)
+
     if plot_engine=='plotly':
+        data = []
+        for x, y, color, legend in zip(xx, yy, colors, legends):
+            if plot_type == 'bar':
+                trace = go.Bar(
+                    x=x,
+                    y=y,
+                    marker=dict(
+                        color=color,
+                    ),
+                    name=legend
+                )
+
+            elif plot_type == 'scatter':
+                trace = go.Scatter(
+                    x=x,
+                    y=y,
+                    mode='lines',
+                    marker=dict(
+                        size=10,
+                        color=color,
+                        line=dict(
+                            width=2,
+                        )
+                    ),
+                    name=legend
+                )
+            data.append(trace)
+
         if plot_type == 'bar':
-            trace = go.Bar(
-                x=x,
-                y=y,
-                marker=dict(
-                    color=color,
-                ),
-            )
             layout = go.Layout(
                 title = title,
                 xaxis=dict(
@@ -113,18 +254,6 @@ def do_plot(plot_engine, title, x,y, plot_type, color, output_html,y_axis_title=
             )
 
         elif plot_type == 'scatter':
-            trace = go.Scatter(
-                x=x,
-                y=y,
-                mode='lines',
-                marker=dict(
-                    size=10,
-                    color=color,
-                    line=dict(
-                        width=2,
-                    )
-                )
-            )
             layout = go.Layout(
                 title=title,
                 xaxis=dict(tickangle=-45),
@@ -132,9 +261,8 @@ def do_plot(plot_engine, title, x,y, plot_type, color, output_html,y_axis_title=
             )
 
         # use plotly to generate a webpage
-            data = [trace]
-            fig = go.Figure(data=data, layout=layout)
-            plotly.offline.plot(fig,filename=output_html)
+        fig = go.Figure(data=data, layout=layout)
+        write_html(fig, output_html)
 
     # use mathplotlib to generate a plot
     elif plot_engine=='mathplotlib':
@@ -143,15 +271,21 @@ def do_plot(plot_engine, title, x,y, plot_type, color, output_html,y_axis_title=
         # ax.plot(x, y)
         plt.figure(figsize=(12,4))
         plt.title(title)
-        plt.legend(loc=0)
         plt.xlabel('Time')
         plt.ylabel(y_axis_title)
 
-        if plot_type == 'bar':
-            # plt.bar(x,y,color='cornflowerblue')
-            plt.bar(x, y, color=color)
-        elif plot_type == 'scatter':
-            plt.step(x,y,label='IMAGING',color=color,linewidth=2)
+        # bars of multiple series are put next to each other within a day
+        width = 0.8 / len(xx)
+        for i, (x, y, color, legend) in enumerate(zip(xx, yy, colors, legends)):
+            if plot_type == 'bar':
+                # plt.bar(x,y,color='cornflowerblue')
+                offset = datetime.timedelta(days=width * (i - (len(xx) - 1) / 2))
+                plt.bar([t + offset for t in x], y, width=width, color=color, label=legend)
+            elif plot_type == 'scatter':
+                plt.step(x,y,label=legend,color=color,linewidth=2)
+
+        if legends[0] is not None:
+            plt.legend(loc=0)
 
         plt.grid(True,alpha=0.3)
         plt.show()
@@ -190,7 +324,7 @@ def do_sky_plot(plot_engine, title, x,y, duration, sizes, output_html,y_axis_tit
         data = [trace]
 
         fig = go.Figure(data=data, layout=layout)
-        plotly.offline.plot(fig,filename=output_html)
+        write_html(fig, output_html)
 
     # use mathplotlib to generate a plot
     elif plot_engine=='mathplotlib':
@@ -273,7 +407,8 @@ def do_speed_plot(title, y_axis_title, subtitle, annotate, datapoints):
                 plt.text(datapoint['timestamp'], datapoint['speed_bps'], datapoint[annotate]+'...',
                           rotation='vertical', fontsize=8)
 
-        if datapoint['type'] == 'ingest_error':
+        # an ingest error before any ingest has no speed to show it at
+        if datapoint['type'] == 'ingest_error' and datapoint['speed_bps'] is not None:
             ingest_error_x.append(datapoint['timestamp'])
             ingest_error_x.append(datapoint['speed_bps'])
 
@@ -298,3 +433,190 @@ def do_speed_plot(title, y_axis_title, subtitle, annotate, datapoints):
 
     plt.show()
 
+
+
+def do_load_plot(title, y_axis_title, subtitle, timestamps, bandwidth, concurrency,
+                 ingest_timestamps, ingest_bandwidth, peak_windows):
+    """
+    :param title: Title of Plot
+    :param timestamps: list with data for x-axis (time)
+    :param bandwidth: list with the combined bandwidth per timestamp
+    :param concurrency: list with the number of concurrent tasks per timestamp
+    :param ingest_timestamps, ingest_bandwidth: the same for only the ingesting tasks
+    :param peak_windows: list of dicts with 'start' and 'end' of the peak load windows
+    :return:
+    """
+
+    fig, ax = plt.subplots(figsize=(12,6))
+
+    plt.text(x=0.5, y=0.94, s=title, fontsize=14, ha="center", transform=fig.transFigure)
+    plt.text(x=0.5, y=0.90, s='query: '+subtitle, fontsize=10, ha="center", transform=fig.transFigure)
+
+    ax.set_xlabel('Timestamp')
+    ax.set_ylabel(y_axis_title)
+    ax.grid(True,alpha=0.3)
+
+    # the values hold until the next timestamp
+    ax.step(timestamps, bandwidth, 'b-', where='post', linewidth=2, label='Total load')
+    ax.step(ingest_timestamps, ingest_bandwidth, 'g-', where='post', linewidth=1, label='Ingesting')
+
+    for window in peak_windows:
+        ax.axvspan(window['start'], window['end'], color='red', alpha=0.2)
+
+    # number of concurrent tasks on a second y-axis
+    ax2 = ax.twinx()
+    ax2.step(timestamps, concurrency, 'k:', where='post', linewidth=1, label='Concurrent tasks')
+    ax2.set_ylabel('Concurrent tasks')
+
+    lines, labels = ax.get_legend_handles_labels()
+    lines2, labels2 = ax2.get_legend_handles_labels()
+    ax.legend(lines + lines2, labels + labels2, loc='upper right')
+
+    plt.show()
+
+
+def do_percentile_plot(title, y_axis_title, subtitle, series, histograms=None):
+    """
+    :param title: Title of Plot
+    :param series: dict with label : (x, y), where x are the days and y the percentile values
+    :param histograms: dict with label : bins, where bins are the (lower bound, upper bound, count) tuples
+                       of a sketch histogram. Drawn as steps next to the percentiles, on a logarithmic axis.
+    :return:
+    """
+
+    if histograms:
+        fig, (ax, ax_histogram) = plt.subplots(1, 2, figsize=(16,6))
+    else:
+        fig, ax = plt.subplots(figsize=(12,6))
+
+    plt.text(x=0.5, y=0.94, s=title, fontsize=14, ha="center", transform=fig.transFigure)
+    plt.text(x=0.5, y=0.90, s='query: '+subtitle, fontsize=10, ha="center", transform=fig.transFigure)
+
+    ax.set_xlabel('Day')
+    ax.set_ylabel(y_axis_title)
+    ax.grid(True,alpha=0.3)
+
+    for label in series:
+        x, y = series[label]
+        ax.plot(x, y, '.-', label=label)
+
+    ax.legend(loc='upper right')
+
+    if histograms:
+        ax_histogram.set_xlabel(y_axis_title)
+        ax_histogram.set_ylabel('Count')
+        ax_histogram.set_xscale('log')
+        ax_histogram.grid(True,alpha=0.3)
+
+        for label in histograms:
+            # the zero bin can not be drawn on a logarithmic axis
+            bins = [bin for bin in histograms[label] if bin[0] > 0]
+            if len(bins) == 0:
+                continue
+            x = [bin[0] for bin in bins] + [bins[-1][1]]
+            y = [bin[2] for bin in bins] + [bins[-1][2]]
+            ax_histogram.step(x, y, where='post', label=label)
+
+        ax_histogram.legend(loc='upper right', fontsize=8)
+
+    plt.show()
+
+
+def init_speed_follow_plot(title, y_axis_title, subtitle):
+    """
+    Create an interactive speed plot that is updated in place by update_speed_follow_plot
+    :param title: Title of Plot
+    :return: dict with the figure, axes and the lines to update
+    """
+    plt.ion()
+    fig, ax = plt.subplots(figsize=(12,6))
+
+    plt.text(x=0.5, y=0.94, s=title, fontsize=14, ha="center", transform=fig.transFigure)
+    plt.text(x=0.5, y=0.90, s='query: '+subtitle, fontsize=10, ha="center", transform=fig.transFigure)
+
+    ax.set_xlabel('Timestamp')
+    ax.set_ylabel(y_axis_title)
+    ax.grid(True,alpha=0.3)
+    ax.xaxis_date()
+
+    plot = {'fig': fig, 'ax': ax}
+    plot['observing'], = ax.plot([], [], 'b.:', label='Observing')
+    plot['ingesting'], = ax.plot([], [], 'g.-', label='Ingesting')
+    plot['ingest_error'], = ax.plot([], [], 'r.', label='Ingest error')
+    ax.legend(loc='upper right')
+
+    plt.show()
+    return plot
+
+
+def update_speed_follow_plot(plot, datapoints):
+    """
+    Replace the data of the lines in the plot, without recreating the figure.
+    The segments from start to end are separated by NaN values, so that every type is a single line.
+    :param plot: dict as returned by init_speed_follow_plot
+    :param datapoints: list of datapoints
+    :return:
+    """
+    x = {'observing': [], 'ingesting': [], 'ingest_error': []}
+    y = {'observing': [], 'ingesting': [], 'ingest_error': []}
+
+    for datapoint in datapoints:
+        type = datapoint['type']
+        if type not in x or datapoint['speed_bps'] is None:
+            continue
+
+        x[type].append(mdates.date2num(datapoint['timestamp']))
+        y[type].append(datapoint['speed_bps'])
+        if datapoint.get('timestamp_end') is not None:
+            x[type].append(mdates.date2num(datapoint['timestamp_end']))
+            y[type].append(datapoint['speed_bps'])
+            x[type].append(np.nan)
+            y[type].append(np.nan)
+
+    for type in x:
+        plot[type].set_data(x[type], y[type])
+
+    plot['ax'].relim()
+    plot['ax'].autoscale_view()
+    plot['fig'].canvas.draw_idle()
+
+
+def pause_plot(interval):
+    """
+    Wait for interval seconds, while keeping the interactive plot responsive.
+    """
+    plt.pause(interval)
+
+
+def do_correlation_plot(title, subtitle, taskids, sizes, durations, speeds, annotate=None):
+    """
+    :param title: Title of Plot
+    :param taskids: list with the taskID per task
+    :param sizes: list with the size of the dataproducts per task (GB)
+    :param durations: list with the ingest duration per task (seconds)
+    :param speeds: list with the ingest speed per task (Gbps)
+    :param annotate: if not None, annotate the datapoints with their taskID
+    :return:
+    """
+
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14,6))
+
+    plt.text(x=0.5, y=0.96, s=title, fontsize=14, ha="center", transform=fig.transFigure)
+    plt.text(x=0.5, y=0.92, s='query: '+subtitle, fontsize=10, ha="center", transform=fig.transFigure)
+
+    ax1.scatter(sizes, durations, c='g', s=10, alpha=0.6)
+    ax1.set_xlabel('Size (GB)')
+    ax1.set_ylabel('Ingest duration (s)')
+    ax1.grid(True,alpha=0.3)
+
+    ax2.scatter(sizes, speeds, c='b', s=10, alpha=0.6)
+    ax2.set_xlabel('Size (GB)')
+    ax2.set_ylabel('Ingest speed (Gbps)')
+    ax2.grid(True,alpha=0.3)
+
+    if annotate is not None:
+        for taskid, size, duration, speed in zip(taskids, sizes, durations, speeds):
+            ax1.text(size, duration, str(taskid), fontsize=8)
+            ax2.text(size, speed, str(taskid), fontsize=8)
+
+    plt.show()
@@ -0,0 +1,153 @@
+"""
+    File name: atdb_remote.py
+    version: 1.0.0 (19 oct 2026)
+    Author: Copyright (C) 2019 - Nico Vermaas - ASTRON
+    Description: remote commands and file transfers over a shared ssh connection
+
+    All ssh and scp calls to a host share one OpenSSH master connection (ControlMaster),
+    so only the first call pays for the ssh handshake. Files are transferred in parallel,
+    and files that have the same size and modification time as the local copy are skipped.
+    Assumes ssh keys have been set up.
+"""
+
+import os
+import shlex
+import shutil
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_WORKERS = 4
+
+# the open connections, per host
+remote_hosts = {}
+
+
+class RemoteHost:
+
+    def __init__(self, host, workers=DEFAULT_WORKERS, control_persist='10m'):
+        """
+        :param host: ssh host, like 'user@host' or an alias from ~/.ssh/config
+        :param workers: number of parallel file transfers
+        :param control_persist: how long the master connection stays open when it is not used
+        """
+        self.host = host
+        self.workers = workers
+        self.connected = False
+
+        # keep the socket path short, unix sockets have a limited path length
+        self.control_dir = tempfile.mkdtemp(prefix='atdb_ssh_')
+        self.control_options = ['-o', 'ControlPath=' + os.path.join(self.control_dir, '%C'),
+                                '-o', 'ControlPersist=' + control_persist]
+        self.ssh_options = ['-o', 'ControlMaster=auto'] + self.control_options
+
+    def connect(self):
+        """
+        Start the master connection in the background, all later calls are multiplexed over it.
+        """
+        if not self.connected:
+            print('connecting to ' + self.host)
+            # with ssh the first value of an option wins, so ControlMaster=auto must not be given here
+            subprocess.run(['ssh', '-o', 'ControlMaster=yes'] + self.control_options + ['-N', '-f', self.host],
+                           check=True)
+            self.connected = True
+
+    def close(self):
+        if self.connected:
+            subprocess.run(['ssh'] + self.ssh_options + ['-O', 'exit', self.host],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            self.connected = False
+        shutil.rmtree(self.control_dir, ignore_errors=True)
+
+    def execute(self, cmd):
+        """ Run command on the remote host
+            cmd: command to run
+            :return: the exit code of the command
+        """
+        self.connect()
+        print("Executing '{}' on {}".format(cmd, self.host))
+        return subprocess.run(['ssh'] + self.ssh_options + [self.host, cmd]).returncode
+
+    def get(self, source, target):
+        """ copy a file from the remote host to a local file, keeping the modification time
+            source: file on the remote host
+            target : the local file.
+        """
+        self.connect()
+        print('scp ' + self.host + ':' + source + ' to ' + target)
+        return subprocess.run(['scp', '-q', '-p'] + self.ssh_options + [self.host + ':' + source, target]).returncode
+
+    def list_files(self, remote_dir):
+        """
+        List the files in a remote directory with a single remote command.
+        :return: dict with remote path : (size, modification time)
+        """
+        self.connect()
+        cmd = "find {} -maxdepth 1 -type f -printf '%s %T@ %p\\n'".format(shlex.quote(remote_dir))
+        output = subprocess.run(['ssh'] + self.ssh_options + [self.host, cmd],
+                                check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+
+        files = {}
+        for line in output.splitlines():
+            size, mtime, path = line.split(' ', 2)
+            files[path] = (int(size), int(float(mtime)))
+        return files
+
+    def get_files(self, transfers, remote_files=None):
+        """
+        Copy files from the remote host in parallel, skip the files that are unchanged.
+        :param transfers: list of (source, target) tuples
+        :param remote_files: dict with remote path : (size, modification time) as returned by list_files,
+                             files that are not in it are always copied.
+        :return: list of the targets that were copied
+        """
+        if remote_files is None:
+            remote_files = {}
+
+        todo = []
+        for source, target in transfers:
+            if source in remote_files and os.path.exists(target):
+                if remote_files[source] == (os.path.getsize(target), int(os.path.getmtime(target))):
+                    continue
+            todo.append((source, target))
+
+        print('copy ' + str(len(todo)) + ' of ' + str(len(transfers)) + ' files from ' + self.host)
+        if len(todo) == 0:
+            return []
+
+        self.connect()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(lambda transfer: self.get(*transfer), todo))
+
+        for (source, target), result in zip(todo, results):
+            if result != 0:
+                raise (Exception("ERROR: scp of " + source + " failed with exit code " + str(result)))
+
+        return [target for source, target in todo]
+
+    def get_dir(self, remote_dir, local_dir):
+        """
+        Copy all files from remote_dir to local_dir, skipping the unchanged files.
+        :return: list of the local files that were copied
+        """
+        remote_files = self.list_files(remote_dir)
+        transfers = [(path, os.path.join(local_dir, os.path.basename(path))) for path in sorted(remote_files)]
+        return self.get_files(transfers, remote_files)
+
+
+def get_remote_host(host, workers=None):
+    """
+    :param workers: number of parallel file transfers, if None the current (or default) number is kept
+    :return: the (shared) RemoteHost for this host
+    """
+    if host not in remote_hosts:
+        remote_hosts[host] = RemoteHost(host)
+    if workers is not None:
+        remote_hosts[host].workers = workers
+    return remote_hosts[host]
+
+
+def close_remote_hosts():
+    for remote_host in remote_hosts.values():
+        remote_host.close()
+    remote_hosts.clear()
@@ -0,0 +1,187 @@
+"""
+    File name: atdb_sketch.py
+    version: 1.0.0 (19 oct 2026)
+    Author: Copyright (C) 2019 - Nico Vermaas - ASTRON
+    Description: mergeable quantile sketches for the ATDB statistics
+
+    The sketch follows the DDSketch idea: values are counted in logarithmic buckets, so that any
+    quantile can be estimated within a fixed relative accuracy. The number of buckets only depends
+    on the range of the values, not on the number of values, and two sketches are merged by
+    adding up their bucket counts. The buckets also serve as a (logarithmic) histogram.
+"""
+
+import os
+import json
+import math
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+
+class QuantileSketch:
+    """
+    Quantile sketch for positive values, like speeds and durations.
+    Zero and negative values are counted separately and treated as 0.
+    """
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        if value is None:
+            return
+
+        if value > 0:
+            index = int(math.ceil(math.log(value) / self.log_gamma))
+            self.buckets[index] = self.buckets.get(index, 0) + 1
+        else:
+            value = 0
+            self.zero_count += 1
+
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """
+        Add the counts of another sketch to this sketch. Both sketches must have the same accuracy.
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise (Exception("ERROR: can not merge sketches with a different relative accuracy"))
+
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def quantile(self, q):
+        """
+        :param q: quantile between 0 and 1, like 0.95
+        :return: the estimated value at quantile q, or None if the sketch is empty
+        """
+        if self.count == 0:
+            return None
+
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0
+
+        seen = self.zero_count
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                # the middle of the bucket, in the relative sense
+                value = 2 * math.pow(self.gamma, index) / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+
+        return self.max
+
+    def mean(self):
+        if self.count == 0:
+            return None
+        return self.sum / self.count
+
+    def histogram(self):
+        """
+        :return: list of (lower bound, upper bound, count) tuples, sorted on bound
+        """
+        bins = []
+        if self.zero_count > 0:
+            bins.append((0, 0, self.zero_count))
+        for index in sorted(self.buckets):
+            bins.append((math.pow(self.gamma, index - 1), math.pow(self.gamma, index), self.buckets[index]))
+        return bins
+
+    def to_dict(self):
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'buckets': {str(index): count for index, count in self.buckets.items()},
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        sketch = cls(d['relative_accuracy'])
+        sketch.buckets = {int(index): count for index, count in d['buckets'].items()}
+        sketch.zero_count = d['zero_count']
+        sketch.count = d['count']
+        sketch.sum = d['sum']
+        sketch.min = d['min']
+        sketch.max = d['max']
+        return sketch
+
+
+def add_to_sketches(sketches, key, name, value, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+    """
+    Add a value to the sketch 'name' under 'key' in a dict of sketches, create the sketch if needed.
+    :param sketches: dict like {key : {name : QuantileSketch}}
+    :param key: the key to group on, like a (day, type) tuple
+    :param name: the name of the measured quantity, like 'speed' or 'duration'
+    """
+    group = sketches.setdefault(key, {})
+    if name not in group:
+        group[name] = QuantileSketch(relative_accuracy)
+    group[name].add(value)
+
+
+def merge_sketches(sketches, other):
+    """
+    Merge all the sketches of 'other' into 'sketches', both are a dict like {key : {name : QuantileSketch}}
+    """
+    for key, group in other.items():
+        target = sketches.setdefault(key, {})
+        for name, sketch in group.items():
+            if name not in target:
+                target[name] = QuantileSketch(sketch.relative_accuracy)
+            target[name].merge(sketch)
+    return sketches
+
+
+def save_sketches(filename, sketches):
+    """
+    Write the sketches to a json file. The (tuple) keys are stored as lists.
+    """
+    records = []
+    for key, group in sketches.items():
+        records.append({'key': list(key),
+                        'sketches': {name: sketch.to_dict() for name, sketch in group.items()}})
+
+    with open(filename, 'w') as f:
+        json.dump(records, f)
+
+
+def load_sketches(filename):
+    """
+    Read the sketches from a json file written by save_sketches.
+    :return: dict like {key : {name : QuantileSketch}}, empty if the file does not exist
+    """
+    sketches = {}
+    if not os.path.exists(filename):
+        return sketches
+
+    with open(filename) as f:
+        records = json.load(f)
+
+    for record in records:
+        sketches[tuple(record['key'])] = {name: QuantileSketch.from_dict(d)
+                                          for name, d in record['sketches'].items()}
+    return sketches
@@ -22,15 +22,17 @@ import os
 import sys
 import datetime
 import time
+import collections
 
 import plotly
-import requests
-import json
-import psycopg2
 
 import argparse
 import plotly.graph_objs as go
 from atdb_statistics import atdb_plot
+from atdb_statistics import atdb_sketch
+from atdb_statistics import atdb_export
+from atdb_statistics import atdb_remote
+from atdb_statistics import atdb_backend
 
 #import numpy as np
 
@@ -47,6 +49,9 @@ ALTA_API_PROD = "https://alta.astron.nl/altapi"
 
 TIME_FORMAT = "%Y-%m-%d %H:%M"
 
+# default plot colors per observing mode
+MODE_COLORS = {'ARTS': '#C8885E', 'IMAGING': '#0081C9'}
+
 #--- common functions ---
 # this is a decorator that can be put in front (around) a function all to measure its execution time
 def timeit(method):
@@ -83,44 +88,71 @@ def scp_filename(host, source, target):
         from_name: file to copy
         to_name : the new file.
     """
-    print('scp '+host+':/' + source+ ' to ' + target)
-    cmd = 'scp ' + host + ':' + source + ' ' + target
-    os.system(cmd)
+    return atdb_remote.get_remote_host(host).get(source, target)
 
 
 def execute_remote_command(host, cmd):
     """ Run command on an ARTS node. Assumes ssh keys have been set up
         cmd: command to run
     """
-    ssh_cmd = "ssh {} \"{}\"".format(host, cmd)
-    print("Executing '{}'".format(ssh_cmd))
-    return os.system(ssh_cmd)
+    return atdb_remote.get_remote_host(host).execute(cmd)
+
+
+def download_remote_dir(host, remote_dir, local_dir, workers=None):
+    """ copy the files from remote_dir on host to local_dir, in parallel and skipping the unchanged files.
+        Assumes ssh keys have been set up
+    """
+    return atdb_remote.get_remote_host(host, workers).get_dir(remote_dir, local_dir)
 
 
 # --- presentation functions ---
 
-def do_ingest_sizes(args, starttime, endtime, plot_engine='plotly'):
+def get_observing_modes(observing_mode):
+    """
+    :param observing_mode: arts, imaging, a comma separated list of them, all or None (all)
+    :return: list of the observing modes to plot, like ['ARTS', 'IMAGING']
+    """
+    if observing_mode is None or observing_mode.lower() == 'all':
+        return ['ARTS', 'IMAGING']
 
-    # connection parameters
-    connection = None
+    observing_modes = []
+    for mode in observing_mode.lower().split(','):
+        if mode.strip() not in ['arts', 'imaging']:
+            raise (Exception("ERROR: unknown observing_mode '" + mode + "'. Possible options: arts, imaging, all"))
+        observing_modes.append(mode.strip().upper())
+    return observing_modes
 
-    try:
 
-        # connect to the PostgreSQL server
-        connection = psycopg2.connect(host = args.atdb_database_host,
-                                      port = args.atdb_database_port,
-                                      database = args.atdb_database_name,
-                                      user = args.atdb_database_user,
-                                      password = args.atdb_database_password)
+def get_aggregations(data_aggregation):
+    """
+    :param data_aggregation: standard, cumulative or all
+    :return: list of the aggregations to plot, like ['standard', 'cumulative']
+    """
+    aggregation = (data_aggregation or 'standard').lower()
+    if aggregation == 'all':
+        return ['standard', 'cumulative']
+    if aggregation not in ['standard', 'cumulative']:
+        raise (Exception("ERROR: unknown data_aggregation '" + data_aggregation + "'. Possible options: standard, cumulative, all"))
+    return [aggregation]
+
+
+def do_ingest_sizes(args, starttime, endtime, plot_engine='plotly'):
 
-        # create a cursor
-        cursor = connection.cursor()
+    # check the options before fetching the data
+    observing_modes = get_observing_modes(args.observing_mode)
+    aggregations = get_aggregations(args.data_aggregation)
+
+    try:
+        backend = atdb_backend.get_backend(args)
 
         # input
         start_date = datetime.datetime.strptime(args.starttime, '%Y-%m-%d %H:%M')
         end_date = datetime.datetime.strptime(args.endtime, '%Y-%m-%d %H:%M')
         curr_date = start_date
 
+        # the sizes of all days at once
+        sizes = backend.fetch_dataproduct_sizes(start_date, end_date)
+
         dates = []
         arts_list = []
         imaging_list = []
@@ -130,27 +162,13 @@ def do_ingest_sizes(args, starttime, endtime, plot_engine='plotly'):
         while curr_date <= end_date:
 
             datestr = datetime.datetime.strftime(curr_date, '%y%m%d')
+            day_sizes = sizes.get(curr_date.replace(hour=0, minute=0), {'ARTS': 0, 'IMAGING': 0})
 
-            cursor.execute(
-                "SELECT sum(size) FROM public.taskdatabase_dataproduct where filename like 'ARTS%s%%'" % datestr)
-            arts = cursor.fetchone()
-
-            cursor.execute(
-                "SELECT sum(size) FROM public.taskdatabase_dataproduct where filename like 'WSRTA%s%%'" % datestr)
-            imaging = cursor.fetchone()
-
-            print(datestr, arts[0], imaging[0])
+            print(datestr, day_sizes['ARTS'], day_sizes['IMAGING'])
             dates.append(curr_date)
 
-            if arts[0] != None:
-                arts_list.append(float(arts[0]) / 1e12)
-            else:
-                arts_list.append(0)
-
-            if imaging[0] != None:
-                imaging_list.append(float(imaging[0]) / 1e12)
-            else:
-                imaging_list.append(0)
+            arts_list.append(day_sizes['ARTS'] / 1e12)
+            imaging_list.append(day_sizes['IMAGING'] / 1e12)
 
             curr_date = curr_date + datetime.timedelta(days=1)
 
@@ -164,28 +182,40 @@ def do_ingest_sizes(args, starttime, endtime, plot_engine='plotly'):
             imaging_cumu.append(j)
 
         print(arts_cumu[-1] / 134.40)
-        # close the communication with the PostgreSQL
-        cursor.close()
 
-        # show the plot
-        if ('IMAGING' in args.observing_mode.upper()):
-            if (args.data_aggregation=='cumulative'):
-                atdb_plot.do_plot(args.plot_engine, args.title, dates, imaging_cumu, args.plot_type, args.color, args.output_html, args.y_axis_title)
-            else:
-                atdb_plot.do_plot(args.plot_engine, args.title, dates, imaging_list, args.plot_type, args.color, args.output_html, args.y_axis_title)
-        elif ('ARTS' in args.observing_mode.upper()):
-            if (args.data_aggregation == 'cumulative'):
-                atdb_plot.do_plot(args.plot_engine, args.title, dates, arts_cumu, args.plot_type, args.color, args.output_html, args.y_axis_title)
+        # export the series
+        if args.export_file != None:
+            atdb_export.export_series(args.export_file, {'date': dates,
+                                                         'arts_tb': arts_list,
+                                                         'imaging_tb': imaging_list,
+                                                         'arts_tb_cumulative': arts_cumu,
+                                                         'imaging_tb_cumulative': imaging_cumu})
+
+        # show the plots, one plot per aggregation with a series per observing mode
+        series = {'standard': {'ARTS': arts_list, 'IMAGING': imaging_list},
+                  'cumulative': {'ARTS': arts_cumu, 'IMAGING': imaging_cumu}}
+
+        for aggregation in aggregations:
+            title = args.title
+            output_html = args.output_html
+            if len(aggregations) > 1 and aggregation != 'standard':
+                title = title + ' (' + aggregation + ')'
+                name, extension = os.path.splitext(output_html)
+                output_html = name + '_' + aggregation + extension
+
+            # the color argument is used for a single observing mode
+            if len(observing_modes) == 1:
+                colors = [args.color]
             else:
-                atdb_plot.do_plot(args.plot_engine, args.title, dates, arts_list, args.plot_type, args.color, args.output_html, args.y_axis_title)
-        #do_plot(args.title+' ARTS', dates, arts_list, args.type, args.output_html, args.y_axis_title)
+                colors = [MODE_COLORS[mode] for mode in observing_modes]
 
-    except (Exception, psycopg2.DatabaseError) as error:
+            atdb_plot.do_plot(args.plot_engine, title,
+                              [dates] * len(observing_modes),
+                              [series[aggregation][mode] for mode in observing_modes],
+                              args.plot_type, colors, output_html, args.y_axis_title, observing_modes)
+
+    except Exception as error:
         print(error)
-    finally:
-        if connection is not None:
-            connection.close()
-            print('Database connection closed.')
 
 
 def do_sky(args, starttime, endtime):
@@ -205,135 +235,441 @@ def do_sky(args, starttime, endtime):
     dec_list = []
     duration_list = []
     sizes_list = []
-    # connection parameters
-    connection = None
+    fieldname_list = []
+    starttime_list = []
+    endtime_list = []
 
     # input parameters
     starttime = datetime.datetime.strptime(args.starttime, '%Y-%m-%d %H:%M')
     endtime = datetime.datetime.strptime(args.endtime, '%Y-%m-%d %H:%M')
 
     try:
+        backend = atdb_backend.get_backend(args)
 
-        # connect to the PostgreSQL server
-        connection = psycopg2.connect(host = args.atdb_database_host,
-                                      port = args.atdb_database_port,
-                                      database = args.atdb_database_name,
-                                      user = args.atdb_database_user,
-                                      password = args.atdb_database_password)
-
-        # create a cursor
-        cursor = connection.cursor()
-
-        # define and execute a sql query
-        query = "SELECT field_ra, field_dec, field_name, starttime, endtime FROM public.taskdatabase_observation WHERE "
-        query += "starttime > '"+ str(starttime) + "' AND endtime < '"+ str(endtime)+"' "
-        query += "AND field_ha IS NULL;"
-        cursor.execute(query)
-
-        # fetch all the data from the query
-
-        records = cursor.fetchall()
-        for record in records:
+        for observation in backend.fetch_observations(starttime, endtime):
             # only plot information about the targets
-            fieldname = record[2]
+            fieldname = observation['field_name']
             if not isCalibrator(fieldname):
-                t1 = record[3]
-                t2 = record[4]
+                t1 = observation['starttime']
+                t2 = observation['endtime']
 
                 duration = (t2 - t1).seconds
                 duration_list.append(int(duration/3600))
                 sizes_list.append(int(duration/360))
-                ra = record[0]
+                ra = observation['field_ra']
                 ra_list.append(ra)
-                dec_list.append(record[1])
-
+                dec_list.append(observation['field_dec'])
+                fieldname_list.append(fieldname)
+                starttime_list.append(t1)
+                endtime_list.append(t2)
+
+        # export the series
+        if args.export_file != None:
+            atdb_export.export_series(args.export_file, {'field_name': fieldname_list,
+                                                         'field_ra': ra_list,
+                                                         'field_dec': dec_list,
+                                                         'starttime': starttime_list,
+                                                         'endtime': endtime_list,
+                                                         'duration_hours': duration_list})
 
         # show the plot
         atdb_plot.do_sky_plot(args.plot_engine, args.title, ra_list, dec_list, duration_list, sizes_list, args.output_html, args.y_axis_title, args.colormap)
 
-    except (Exception, psycopg2.DatabaseError) as error:
+    except Exception as error:
         print(error)
 
-    finally:
-        if connection:
-            cursor.close()
-            connection.close()
-            print('Database connection closed.')
+def get_datapoints_from_result(result, prev_ingest_speed=None):
+    """
+    Convert a single result of the /times endpoint into datapoints
+    of the type 'observing', 'ingesting' or 'ingest_error'.
+    :param result: a result of the /times endpoint
+    :param prev_ingest_speed: speed to show an ingest_error at, when the result itself has no ingest speed
+    :return: list of datapoints, and the (last) ingest speed
+    """
+    datapoints = []
+    if result['write_speed'] > 0:
+        datapoint = {}
+        datapoint['taskid'] = result['taskID']
+        timestamp = datetime.datetime.strptime(result['starttime'], '%Y-%m-%dT%H:%M:%SZ')
+        datapoint['timestamp'] = timestamp
+        datapoint['type'] = 'observing'
+        #datapoint['duration'] = result['duration']
+        datapoint['timestamp_end'] = timestamp + datetime.timedelta(seconds=result['duration'])
+        datapoint['speed_bps'] = result['write_speed'] * 8 / 1000
+        datapoints.append(datapoint)
+        #print(datapoint)
+
+    if result['ingest_speed'] is not None:
+        datapoint = {}
+        datapoint['taskid'] = result['taskID']
+        nofrag,frag = result['timestamp_ingesting'].split('.')
+        timestamp = datetime.datetime.strptime(nofrag, '%Y-%m-%dT%H:%M:%S')
+        datapoint['timestamp'] = timestamp
+        datapoint['type'] = 'ingesting'
+        datapoint['duration'] = result['ingest_duration']
+        datapoint['timestamp_end'] = timestamp + datetime.timedelta(seconds=result['ingest_duration'])
+        datapoint['speed_bps'] = result['ingest_speed'] * 8 / 1000
+        datapoints.append(datapoint)
+
+        prev_ingest_speed = datapoint['speed_bps']
+        # print(datapoint)
+
+    if result['timestamp_ingest_error'] is not None:
+        datapoint = {}
+        datapoint['taskid'] = result['taskID']
+        nofrag,frag = result['timestamp_ingest_error'].split('.')
+        timestamp = datetime.datetime.strptime(nofrag, '%Y-%m-%dT%H:%M:%S')
+        datapoint['timestamp'] = timestamp
+        datapoint['type'] = 'ingest_error'
+        datapoint['speed_bps'] = prev_ingest_speed
+        datapoints.append(datapoint)
+
+    return datapoints, prev_ingest_speed
+
+
+def get_speed_datapoints(args):
+    """
+    Request the /times endpoint of the ATDB backend and convert the results into datapoints
+    of the type 'observing', 'ingesting' or 'ingest_error'.
+    :param args: the arguments, uses args.atdb_host and args.query
+    :return: list of datapoints, sorted on timestamp
+    """
+    results = atdb_backend.get_backend(args).fetch_times(args.query)
+
+    # analyse the results
+    print('analyse the results.')
+    datapoints = []
+    prev_ingest_speed = None
+    for result in results:
+        result_datapoints, prev_ingest_speed = get_datapoints_from_result(result, prev_ingest_speed)
+        datapoints.extend(result_datapoints)
+
+    sorted_datapoints = sorted(datapoints, key=lambda k: k['timestamp'])
+    return sorted_datapoints
+
+
+def compute_concurrent_load(datapoints, types=('observing','ingesting')):
+    """
+    Sweep over the start and end events of the datapoints to calculate the combined bandwidth
+    and the number of concurrent tasks over time. Sorting the events makes this O(n log n).
+    :param datapoints: datapoints as returned by get_speed_datapoints
+    :param types: the datapoint types that contribute to the load
+    :return: timestamps, bandwidth and concurrency lists. Each value holds until the next timestamp.
+    """
+    events = []
+    for datapoint in datapoints:
+        if datapoint['type'] in types and datapoint.get('timestamp_end') is not None:
+            events.append((datapoint['timestamp'], 1, datapoint['speed_bps']))
+            events.append((datapoint['timestamp_end'], -1, -datapoint['speed_bps']))
+
+    # on equal timestamps the end events (-1) are handled before the start events (+1)
+    events.sort(key=lambda k: (k[0], k[1]))
+
+    timestamps = []
+    bandwidth = []
+    concurrency = []
+    current_bandwidth = 0
+    current_concurrency = 0
+    for timestamp, delta, speed in events:
+        current_bandwidth += speed
+        current_concurrency += delta
+
+        # collapse all the events on the same timestamp into a single step
+        if len(timestamps) > 0 and timestamps[-1] == timestamp:
+            bandwidth[-1] = current_bandwidth
+            concurrency[-1] = current_concurrency
+        else:
+            timestamps.append(timestamp)
+            bandwidth.append(current_bandwidth)
+            concurrency.append(current_concurrency)
+
+    return timestamps, bandwidth, concurrency
+
+
+def find_peak_windows(timestamps, bandwidth, concurrency, peak_fraction=0.9):
+    """
+    Find the time windows in which the bandwidth is at least peak_fraction of the maximum bandwidth.
+    Adjacent steps above the threshold are merged into one window.
+    :param timestamps, bandwidth, concurrency: the step series from compute_concurrent_load
+    :param peak_fraction: fraction of the maximum bandwidth that counts as peak load
+    :return: list of windows, a window is a dict with start, end, max_bandwidth and max_concurrency
+    """
+    windows = []
+    if len(bandwidth) == 0:
+        return windows
+
+    threshold = max(bandwidth) * peak_fraction
+    window = None
+    for i in range(0, len(timestamps) - 1):
+        # the bandwidth is a running sum of floats, so it is not always exactly 0 when no task is running
+        if concurrency[i] > 0 and bandwidth[i] >= threshold:
+            if window is None:
+                window = {'start': timestamps[i], 'max_bandwidth': 0, 'max_concurrency': 0}
+                windows.append(window)
+            window['end'] = timestamps[i + 1]
+            window['max_bandwidth'] = max(window['max_bandwidth'], bandwidth[i])
+            window['max_concurrency'] = max(window['max_concurrency'], concurrency[i])
+        else:
+            window = None
+
+    return windows
+
 
 @timeit
 def do_ingest_speeds(args):
+    sorted_datapoints = get_speed_datapoints(args)
 
-    # The request header
-    ATDB_HEADER = {
-        'content-type': "application/json",
-        'cache-control': "no-cache",
-        'authorization': "Basic YWRtaW46YWRtaW4="
-    }
+    # export the series
+    if args.export_file != None:
+        atdb_export.export_series(args.export_file, atdb_export.datapoints_to_columns(
+            sorted_datapoints, ['taskid', 'type', 'timestamp', 'timestamp_end', 'duration', 'speed_bps']),
+            types={'timestamp': 'timestamp[us]', 'timestamp_end': 'timestamp[us]',
+                   'duration': 'int64', 'speed_bps': 'float64'})
 
-    # input parameters
+    # plot the results
+    atdb_plot.do_speed_plot(args.title, args.y_axis_title, args.query, args.annotate, sorted_datapoints)
 
-    url = args.atdb_host + "/times?" + str(args.query)
 
-    # do the request to the ATDB backend
-    print('request to '+url)
-    response = requests.request("GET", url, headers=ATDB_HEADER)
+def is_ingest_finished(result):
+    """
+    :return: True if the ingest of this /times result has finished, successfully or with an error
+    """
+    return result['ingest_speed'] is not None or result['timestamp_ingest_error'] is not None
+
+
+def do_ingest_speeds_follow(args):
+    """
+    Follow the ingests in progress. The /times endpoint is polled every follow_interval seconds for only the
+    results past the last seen value of follow_field. While tasks in the buffer are still waiting for their ingest,
+    the poll starts at the oldest of those tasks instead, so that their ingest shows up when it is done.
+    Either way every poll is a single query.
+    New or changed tasks replace their datapoints in a bounded buffer (the oldest tasks are dropped when it is full)
+    and the figure is updated in place. A failed poll is reported and retried at the next interval.
+    Stop with ctrl-c.
+    :param args:
+    :return:
+    """
+    # taskid : datapoints, in the order in which the tasks were last seen
+    buffer = collections.OrderedDict()
+    buffer_size = int(args.follow_buffer)
+    last_seen = None
+    prev_ingest_speed = None
+
+    # taskid : result, of the tasks in the buffer that are not ingested yet
+    open_tasks = {}
+
+    # always ask the source for the latest results, not the cache
+    backend = atdb_backend.get_backend(args, cache=False)
+
+    plot = atdb_plot.init_speed_follow_plot(args.title, args.y_axis_title, args.query)
 
-    # parse the response
     try:
-        json_response = json.loads(response.text)
-        results = json_response["results"]
+        while True:
+            query = args.query
+            open_values = [open_result.get(args.follow_field) for open_result in open_tasks.values()]
+            open_values = [value for value in open_values if value is not None]
+            if len(open_values) > 0:
+                # poll again from the oldest task that is waiting for its ingest
+                query = query + '&' + args.follow_field + '__gte=' + min(open_values)
+            elif last_seen is not None:
+                query = query + '&' + args.follow_field + '__gt=' + last_seen
+
+            try:
+                polled = list(backend.fetch_times(query))
+            except Exception as error:
+                print('poll failed: ' + str(error))
+                atdb_plot.pause_plot(float(args.follow_interval))
+                continue
+
+            # keep the new tasks and the waiting tasks that have changed, merged on taskID
+            results = []
+            for result in polled:
+                value = result.get(args.follow_field)
+                is_new = last_seen is None or (value is not None and value > last_seen)
+                open_result = open_tasks.get(result['taskID'])
+                if is_new or (open_result is not None and result != open_result):
+                    results.append(result)
+
+            for result in results:
+                value = result.get(args.follow_field)
+                if value is not None and (last_seen is None or value > last_seen):
+                    last_seen = value
+
+                datapoints, prev_ingest_speed = get_datapoints_from_result(result, prev_ingest_speed)
+                buffer[result['taskID']] = datapoints
+                buffer.move_to_end(result['taskID'])
+
+                if is_ingest_finished(result):
+                    open_tasks.pop(result['taskID'], None)
+                else:
+                    open_tasks[result['taskID']] = result
+
+            while len(buffer) > buffer_size:
+                taskid, datapoints = buffer.popitem(last=False)
+                open_tasks.pop(taskid, None)
+
+            print(str(len(results)) + ' new or changed tasks, ' + str(len(buffer)) + ' tasks in buffer, ' +
+                  str(len(open_tasks)) + ' waiting for their ingest.')
+            if len(results) > 0:
+                datapoints = [datapoint for task_datapoints in buffer.values() for datapoint in task_datapoints]
+                atdb_plot.update_speed_follow_plot(plot, sorted(datapoints, key=lambda k: k['timestamp']))
+
+            atdb_plot.pause_plot(float(args.follow_interval))
+
+    except KeyboardInterrupt:
+        print('stopped following.')
 
-    except Exception as err:
-        print("Exception : " + str(err))
-        raise (Exception(
-            "ERROR: " + str(response.status_code) + ", " + str(response.reason) + ', ' + str(response.content)))
 
-    # analyse the results
+@timeit
+def do_ingest_correlation(args):
+    """
+    Relate the size of the dataproducts of a task to its ingest duration and ingest speed.
+    The ingests are read from the /times endpoint and indexed on taskID, then the sizes of all these tasks
+    are fetched from the database in one query and joined on taskID.
+    :param args:
+    :return:
+    """
+
+    # index the ingests on taskID
+    ingests = {}
+    backend = atdb_backend.get_backend(args)
+    for result in backend.fetch_times(args.query):
+        if result['ingest_speed'] is not None and result['ingest_duration'] is not None:
+            ingests[result['taskID']] = result
+
+    print(str(len(ingests)) + ' ingested tasks found.')
+    if len(ingests) == 0:
+        return
+
+    # get the sizes of all the ingested tasks at once
+    sizes = backend.fetch_task_sizes(ingests.keys())
+
+    # join on taskID
+    taskids = []
+    sizes_gb = []
+    durations = []
+    speeds = []
+    for taskid, size in sizes.items():
+        result = ingests.get(taskid)
+        if result is None:
+            continue
+        taskids.append(taskid)
+        sizes_gb.append(size / 1e9)
+        durations.append(result['ingest_duration'])
+        speeds.append(result['ingest_speed'] * 8 / 1000)
+
+    print(str(len(taskids)) + ' tasks with both a size and an ingest speed.')
+
+    # export the series
+    if args.export_file != None:
+        atdb_export.export_series(args.export_file, {'taskid': taskids,
+                                                     'size_gb': sizes_gb,
+                                                     'ingest_duration': durations,
+                                                     'ingest_speed_gbps': speeds})
+
+    # plot the results
+    atdb_plot.do_correlation_plot(args.title, args.query, taskids, sizes_gb, durations, speeds, args.annotate)
+
+
+@timeit
+def do_ingest_load(args):
+    """
+    Show the combined I/O load of all overlapping observing and ingesting tasks,
+    and report the peak load windows.
+    :param args:
+    :return:
+    """
+    sorted_datapoints = get_speed_datapoints(args)
+
+    # analyse the combined load
+    print('sweep over the start and end events.')
+    timestamps, bandwidth, concurrency = compute_concurrent_load(sorted_datapoints)
+    ingest_timestamps, ingest_bandwidth, ingest_concurrency = \
+        compute_concurrent_load(sorted_datapoints, types=('ingesting',))
+
+    peak_windows = find_peak_windows(timestamps, bandwidth, concurrency, float(args.peak_fraction))
+
+    print('PEAK WINDOWS (>= ' + str(args.peak_fraction) + ' of maximum load)')
+    print('START END MAX_BANDWIDTH MAX_CONCURRENCY')
+    for window in peak_windows:
+        print(window['start'], window['end'], round(window['max_bandwidth'], 2), window['max_concurrency'])
+
+    # plot the results
+    atdb_plot.do_load_plot(args.title, args.y_axis_title, args.query,
+                           timestamps, bandwidth, concurrency,
+                           ingest_timestamps, ingest_bandwidth, peak_windows)
+
+
+
+@timeit
+def do_ingest_statistics(args):
+    """
+    Summarize the write and ingest speeds and durations from the /times endpoint in quantile sketches
+    per day and type. The /times results do not say on which node a task ran, so there is no grouping per node.
+    The results are streamed page by page into the sketches, so arbitrary long
+    ranges can be summarized without keeping the datapoints in memory.
+    When a sketch_file is given, the sketches of previous runs are merged with the new ones and saved again.
+    :param args:
+    :return:
+    """
+    PERCENTILES = [0.50, 0.95, 0.99]
+
+    sketches = {}
+    relative_accuracy = float(args.sketch_accuracy)
+
     print('analyse the results.')
-    datapoints = []
-    for result in results:
+    for result in atdb_backend.get_backend(args).fetch_times(args.query):
         if result['write_speed'] > 0:
-            datapoint = {}
-            datapoint['taskid'] = result['taskID']
             timestamp = datetime.datetime.strptime(result['starttime'], '%Y-%m-%dT%H:%M:%SZ')
-            datapoint['timestamp'] = timestamp
-            datapoint['type'] = 'observing'
-            #datapoint['duration'] = result['duration']
-            datapoint['timestamp_end'] = timestamp + datetime.timedelta(seconds=result['duration'])
-            datapoint['speed_bps'] = result['write_speed'] * 8 / 1000
-            datapoints.append(datapoint)
-            #print(datapoint)
+            key = (timestamp.strftime('%Y-%m-%d'), 'observing')
+            atdb_sketch.add_to_sketches(sketches, key, 'speed', result['write_speed'] * 8 / 1000, relative_accuracy)
+            atdb_sketch.add_to_sketches(sketches, key, 'duration', result['duration'], relative_accuracy)
 
         if result['ingest_speed'] is not None:
-            datapoint = {}
-            datapoint['taskid'] = result['taskID']
             nofrag,frag = result['timestamp_ingesting'].split('.')
             timestamp = datetime.datetime.strptime(nofrag, '%Y-%m-%dT%H:%M:%S')
-            datapoint['timestamp'] = timestamp
-            datapoint['type'] = 'ingesting'
-            datapoint['duration'] = result['ingest_duration']
-            datapoint['timestamp_end'] = timestamp + datetime.timedelta(seconds=result['ingest_duration'])
-            datapoint['speed_bps'] = result['ingest_speed'] * 8 / 1000
-            datapoints.append(datapoint)
-
-            prev_ingest_speed = datapoint['speed_bps']
-            # print(datapoint)
-
-        if result['timestamp_ingest_error'] is not None:
-            datapoint = {}
-            datapoint['taskid'] = result['taskID']
-            nofrag,frag = result['timestamp_ingest_error'].split('.')
-            timestamp = datetime.datetime.strptime(nofrag, '%Y-%m-%dT%H:%M:%S')
-            datapoint['timestamp'] = timestamp
-            datapoint['type'] = 'ingest_error'
-            datapoint['speed_bps'] = prev_ingest_speed
-            datapoints.append(datapoint)
-
-    sorted_datapoints = sorted(datapoints, key=lambda k: k['timestamp'])
-
-    # plot the results
-    atdb_plot.do_speed_plot(args.title, args.y_axis_title, args.query, args.annotate, sorted_datapoints)
-
+            key = (timestamp.strftime('%Y-%m-%d'), 'ingesting')
+            atdb_sketch.add_to_sketches(sketches, key, 'speed', result['ingest_speed'] * 8 / 1000, relative_accuracy)
+            atdb_sketch.add_to_sketches(sketches, key, 'duration', result['ingest_duration'], relative_accuracy)
+
+    # merge with the sketches of previous runs
+    if args.sketch_file != None:
+        sketches = atdb_sketch.merge_sketches(atdb_sketch.load_sketches(args.sketch_file), sketches)
+        atdb_sketch.save_sketches(args.sketch_file, sketches)
+        print('sketches saved to ' + args.sketch_file)
+
+    # report per day/type
+    print('DAY TYPE COUNT SPEED(p50,p95,p99) DURATION(p50,p95,p99)')
+    totals = {}
+    for key in sorted(sketches):
+        group = sketches[key]
+        speeds = [round(group['speed'].quantile(q), 2) for q in PERCENTILES]
+        durations = [int(group['duration'].quantile(q) or 0) for q in PERCENTILES]
+        print(key[0], key[1], group['speed'].count, speeds, durations)
+
+        atdb_sketch.merge_sketches(totals, {key[1:]: group})
+
+    # report over the whole range
+    print('TYPE COUNT SPEED(p50,p95,p99) DURATION(p50,p95,p99)')
+    for key in sorted(totals):
+        group = totals[key]
+        speeds = [round(group['speed'].quantile(q), 2) for q in PERCENTILES]
+        durations = [int(group['duration'].quantile(q) or 0) for q in PERCENTILES]
+        print(key[0], group['speed'].count, speeds, durations)
+
+    # plot the daily percentiles and histograms of the speeds
+    series = {}
+    histograms = {}
+    for key in sorted(sketches):
+        day = datetime.datetime.strptime(key[0], '%Y-%m-%d')
+        for q in PERCENTILES:
+            label = key[1] + ' p' + str(int(q * 100))
+            x, y = series.setdefault(label, ([], []))
+            x.append(day)
+            y.append(sketches[key]['speed'].quantile(q))
+        histograms[key[0] + ' ' + key[1]] = sketches[key]['speed'].histogram()
+
+    atdb_plot.do_percentile_plot(args.title, args.y_axis_title, args.query, series, histograms)
 
 
 def get_arguments(parser):
@@ -384,6 +720,15 @@ def main():
     parser.add_argument("--atdb_api",
                         default="192.168.22.25/atdb",
                         help="ATDB ReST API")
+    parser.add_argument("--fixture",
+                        default=None,
+                        help="SQLite file to read all the data from instead of the ATDB database and ReST API (see atdb_backend.create_fixture)")
+    parser.add_argument("--record_fixture",
+                        default=None,
+                        help="fill this SQLite fixture with the data between starttime and endtime from the ATDB database, and with the /times results of the query from the ReST API. No presentation is made.")
+    parser.add_argument("--cache_dir",
+                        default=None,
+                        help="directory to cache the fetched data in, the same fetch is then read from the cache")
     parser.add_argument("--plot_engine",
                         default="plotly",
                         help="options are: 'plotly' (for webpage)or 'mathplotlib")
@@ -405,6 +750,9 @@ def main():
     parser.add_argument("--remote_post_command",
                         default=None,
                         help="execute this command on the remote host after generating the html results.")
+    parser.add_argument("--remote_workers",
+                        default="4",
+                        help="number of parallel file transfers from the remote host. Every transfer is a session on the same ssh master connection, so values above the MaxSessions of the sshd (default 10) will fail")
     parser.add_argument("--local_dir",
                         default='',
                         help="local directory where the data files are stored or read")
@@ -416,18 +764,33 @@ def main():
     parser.add_argument("--output_html",
                         default="atdb_plot.html",
                         help="output html file")
+    parser.add_argument("--export_file",
+                        default=None,
+                        help="also export the series behind the plot (ingest_sizes, sky, ingest_speed, ingest_correlation) to this file. Possible extensions: .parquet, .arrow, .feather, .csv")
+    parser.add_argument("--output_precision",
+                        default="6",
+                        help="number of significant digits of the floats in the html output, 'none' keeps all digits")
+    parser.add_argument("--include_plotlyjs",
+                        default="true",
+                        help="how the html output gets plotly.js. Possible options: true (inline), cdn, directory (a shared plotly.min.js next to the html)")
+    parser.add_argument("--compress",
+                        default="gzip,br",
+                        help="precompressed variants of the html output to write for serving. Possible options: gzip, br, none")
+    parser.add_argument("--size_budget",
+                        default="1024",
+                        help="size budget in KB of the served html output, a warning is given above it")
     parser.add_argument("--presentation",
                         default=None,
-                        help="Possible options: ingest_sizes")
+                        help="Possible options: ingest_sizes, sky, ingest_speed, ingest_load, ingest_statistics, ingest_correlation")
     parser.add_argument("--data_aggregation",
                         default="standard",
-                        help="Possible options: cumulative, standard")
+                        help="Possible options: cumulative, standard, all (a plot per aggregation, the cumulative output_html gets a '_cumulative' suffix)")
     parser.add_argument("--mode",
                         default=None,
                         help="Default modes. Possible options: today, this_week, this_month, this_year")
     parser.add_argument("--observing_mode",
                         default=None,
-                        help="Observingmode")
+                        help="Observingmode. Possible options: arts, imaging, all (ingest_sizes plots a series per mode, None means all)")
     parser.add_argument("--starttime",
                         default=None,
                         help="Format like 2019-01-12 00:00")
@@ -440,6 +803,28 @@ def main():
     parser.add_argument("--annotate",
                         default=None,
                         help="field to annotate datapoints in the (speed) plot, like 'taskid'")
+    parser.add_argument("--peak_fraction",
+                        default="0.9",
+                        help="fraction of the maximum load that is reported as a peak load window (ingest_load presentation)")
+    parser.add_argument("--follow",
+                        default=False,
+                        help="keep polling the ATDB backend for new or changed results and update the (ingest_speed) plot.",
+                        action="store_true")
+    parser.add_argument("--follow_interval",
+                        default="60",
+                        help="seconds between polls in follow mode")
+    parser.add_argument("--follow_field",
+                        default="starttime",
+                        help="field of the /times results to poll past for new tasks in follow mode, like starttime. It should be set for every task, because tasks waiting for their ingest are polled again from the oldest value of this field.")
+    parser.add_argument("--follow_buffer",
+                        default="1000",
+                        help="maximum number of tasks to keep in follow mode, the oldest tasks are dropped first")
+    parser.add_argument("--sketch_file",
+                        default=None,
+                        help="json file to merge and save the quantile sketches in (ingest_statistics presentation). Use non overlapping queries per run, otherwise tasks are counted twice.")
+    parser.add_argument("--sketch_accuracy",
+                        default="0.01",
+                        help="relative accuracy of the quantile sketches (ingest_statistics presentation)")
     parser.add_argument("--interval",
                         default="day",
                         help="Shows bars per interval. Possible options: minute, hour, day, month")
@@ -504,27 +889,58 @@ def main():
         endtime = datetime.datetime.now()
         starttime = endtime.replace(month=1,day=1, hour=0, minute=0)
 
-    if args.remote_pre_command != None:
-        execute_remote_command(args.atdb_host, args.remote_pre_command)
+    # options for the html output
+    atdb_plot.set_output_options(
+        precision = None if args.output_precision.lower()=='none' else int(args.output_precision),
+        include_plotlyjs = True if args.include_plotlyjs.lower()=='true' else args.include_plotlyjs,
+        compress = [] if args.compress.lower()=='none' else args.compress.split(','),
+        size_budget = int(args.size_budget) * 1024)
+
+    try:
+        if args.remote_pre_command != None:
+            execute_remote_command(args.atdb_host, args.remote_pre_command)
+
+        if args.remote_dir != None:
+            download_remote_dir(args.atdb_host, args.remote_dir, args.local_dir, int(args.remote_workers))
+
+        if args.record_fixture != None:
+            atdb_backend.record_fixture(args, args.record_fixture, starttime, endtime)
+            return
+
+        # determine the type of presentation
+        presentation = args.presentation
 
-    # determine the type of presentation
-    presentation = args.presentation
+        # for backward compatibility with version 1.0,
+        # the presentation mode was interpreted from the definition of the datafiles
 
-    # for backward compatibility with version 1.0,
-    # the presentation mode was interpreted from the definition of the datafiles
+        # for a single dataset
+        if presentation=="ingest_sizes":
+           do_ingest_sizes(args, starttime, endtime)
 
-    # for a single dataset
-    if presentation=="ingest_sizes":
-       do_ingest_sizes(args, starttime, endtime)
+        elif presentation=="sky":
+           do_sky(args, starttime, endtime)
 
-    elif presentation=="sky":
-       do_sky(args, starttime, endtime)
+        elif presentation=="ingest_speed":
+           if args.follow:
+               do_ingest_speeds_follow(args)
+           else:
+               do_ingest_speeds(args)
 
-    elif presentation=="ingest_speed":
-       do_ingest_speeds(args)
+        elif presentation=="ingest_load":
+           do_ingest_load(args)
 
-    if args.remote_post_command != None:
-        execute_remote_command(args.atdb_host, args.remote_post_command)
+        elif presentation=="ingest_statistics":
+           do_ingest_statistics(args)
+
+        elif presentation=="ingest_correlation":
+           do_ingest_correlation(args)
+
+        if args.remote_post_command != None:
+            execute_remote_command(args.atdb_host, args.remote_post_command)
+
+    finally:
+        # close the shared ssh connections, also when a presentation fails
+        atdb_remote.close_remote_hosts()
 
 
 if __name__ == "__main__":
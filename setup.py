@@ -8,6 +8,7 @@ setup(name='atdb_plot',
       author_email='nvermaas@astron.nl',
       license='BSD',
       install_requires=['plotly','requests','psycopg2'],
+      extras_require={'export': ['pyarrow'], 'compress': ['brotli']},
       packages=find_packages(),
       entry_points={
             'console_scripts': [
@@ -0,0 +1,169 @@
+"""
+    Checks of the data-source backends, against the fixture in data/atdb_fixture.sqlite3
+    Run with: python -m pytest tests
+"""
+
+import io
+import os
+import sys
+import csv
+import shutil
+import datetime
+import tempfile
+import unittest
+import contextlib
+
+import matplotlib
+matplotlib.use('Agg')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import atdb_stats
+from atdb_statistics import atdb_backend
+
+FIXTURE = os.path.join(ROOT, 'data', 'atdb_fixture.sqlite3')
+
+
+class FakePsycopgCursor:
+    """
+    Formats the query like psycopg2 does: '%' is only interpreted when parameters are given.
+    """
+    def __init__(self, records):
+        self.records = records
+        self.queries = []
+
+    def execute(self, query, params=None):
+        if params is not None:
+            query = query % tuple("'" + str(param) + "'" for param in params)
+        self.queries.append(query)
+
+    def fetchall(self):
+        return self.records
+
+    def close(self):
+        pass
+
+
+class FakePsycopgConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+    def close(self):
+        pass
+
+
+class FakePostgresBackend(atdb_backend.PostgresBackend):
+    def __init__(self, cursor):
+        atdb_backend.PostgresBackend.__init__(self, 'localhost', '5432', 'atdb', 'atdbread', '')
+        self.cursor = cursor
+
+    def connect(self):
+        return FakePsycopgConnection(self.cursor)
+
+
+class TestSqlBackend(unittest.TestCase):
+
+    def test_postgres_queries_are_formatted_like_psycopg2(self):
+        cursor = FakePsycopgCursor([('ARTS', '190311', 2e12)])
+        backend = FakePostgresBackend(cursor)
+
+        sizes = backend.fetch_dataproduct_sizes(datetime.datetime(2019, 3, 11), datetime.datetime(2019, 3, 12))
+        self.assertEqual(sizes, {datetime.datetime(2019, 3, 11): {'ARTS': 2e12, 'IMAGING': 0}})
+
+        query = cursor.queries[-1]
+        self.assertIn("LIKE 'ARTS%'", query)
+        self.assertIn("filename >= 'ARTS190311' AND filename < 'ARTS190313'", query)
+
+    def test_chain_falls_back_when_postgres_is_down(self):
+        down = atdb_backend.PostgresBackend('127.0.0.1', '1', 'atdb', 'atdbread', '')
+        backend = atdb_backend.ChainBackend([down, atdb_backend.SQLiteBackend(FIXTURE)])
+
+        sizes = backend.fetch_dataproduct_sizes(datetime.datetime(2019, 3, 11), datetime.datetime(2019, 3, 17))
+        self.assertEqual(len(sizes), 7)
+
+    def test_chain_routes_silently_past_backends_without_the_data(self):
+        # postgres has no times, which is normal routing and not worth a message
+        postgres = atdb_backend.PostgresBackend('127.0.0.1', '1', 'atdb', 'atdbread', '')
+        backend = atdb_backend.ChainBackend([postgres, atdb_backend.SQLiteBackend(FIXTURE)])
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            results = list(backend.fetch_times('taskID=190311001'))
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(output.getvalue(), '')
+
+    def test_fixture_times_query(self):
+        backend = atdb_backend.SQLiteBackend(FIXTURE)
+        results = list(backend.fetch_times('taskID__contains=190311&starttime__gt=2019-03-11T05:00:00Z'))
+        self.assertEqual(sorted([result['taskID'] for result in results]), ['190311002', '190311003', '190311004'])
+
+
+class FixtureTestCase(unittest.TestCase):
+    """
+    Runs the presentations against the fixture and reads back their exported series.
+    """
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def export_presentation(self, extension, *arguments):
+        """
+        :return: the export file, with the given extension
+        """
+        export_file = os.path.join(self.output_dir, 'export' + extension)
+        sys.argv = ['atdb_stats.py',
+                    '--fixture=' + FIXTURE,
+                    '--plot_engine=mathplotlib',
+                    '--starttime=2019-03-11 00:00',
+                    '--endtime=2019-03-17 23:59',
+                    '--export_file=' + export_file] + list(arguments)
+        atdb_stats.main()
+        return export_file
+
+    def run_presentation(self, *arguments):
+        """
+        :return: the rows of the CSV export
+        """
+        with open(self.export_presentation('.csv', *arguments)) as f:
+            return list(csv.DictReader(f))
+
+
+class TestPresentationsAgainstFixture(FixtureTestCase):
+
+    def test_ingest_sizes(self):
+        rows = self.run_presentation('--presentation=ingest_sizes', '--observing_mode=all', '--data_aggregation=all')
+
+        self.assertEqual(len(rows), 7)
+        for row in rows:
+            self.assertGreater(float(row['arts_tb']), 0)
+            self.assertGreater(float(row['imaging_tb']), 0)
+
+        arts_total = sum([float(row['arts_tb']) for row in rows])
+        self.assertAlmostEqual(float(rows[-1]['arts_tb_cumulative']), arts_total)
+
+    def test_sky(self):
+        rows = self.run_presentation('--presentation=sky')
+
+        self.assertGreater(len(rows), 0)
+        for row in rows:
+            self.assertFalse(atdb_stats.isCalibrator(row['field_name']))
+
+    def test_ingest_correlation(self):
+        rows = self.run_presentation('--presentation=ingest_correlation', '--query=starttime__gt=2019-03-11T00:00:00Z')
+
+        # one of the tasks is still waiting for its ingest
+        self.assertEqual(len(rows), 27)
+        for row in rows:
+            self.assertGreater(float(row['size_gb']), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
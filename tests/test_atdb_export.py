@@ -0,0 +1,85 @@
+"""
+    Checks of the export of the series, against the fixture in data/atdb_fixture.sqlite3
+    The Parquet and Arrow checks need pyarrow and are skipped otherwise.
+    Run with: python -m pytest tests
+"""
+
+import os
+import sys
+import datetime
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from test_atdb_backend import FixtureTestCase
+from atdb_statistics import atdb_export
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# the speeds of the tasks of 2019-03-17 from 12:00, the last of which failed its ingest
+SPEED_QUERY = ('--presentation=ingest_speed',
+               '--query=taskID__contains=1903170&starttime__gt=2019-03-17T12:00:00Z')
+
+SIZES_QUERY = ('--presentation=ingest_sizes', '--observing_mode=all', '--data_aggregation=standard')
+
+
+class TestExportAgainstFixture(FixtureTestCase):
+
+    def test_csv(self):
+        rows = self.run_presentation(*SPEED_QUERY)
+
+        self.assertEqual([(row['taskid'], row['type']) for row in rows],
+                         [('190317004', 'observing'), ('190317005', 'observing'), ('190317005', 'ingest_error')])
+        self.assertEqual(rows[0]['timestamp'], '2019-03-17T16:00:00')
+        self.assertEqual(rows[0]['timestamp_end'], '2019-03-17T20:00:00')
+
+        # missing values are written as empty fields
+        self.assertEqual(rows[0]['duration'], '')
+        self.assertEqual(rows[2]['speed_bps'], '')
+
+    @unittest.skipIf(pa is None, 'pyarrow is not installed')
+    def test_parquet(self):
+        csv_rows = self.run_presentation(*SIZES_QUERY)
+        table = atdb_export.read_series(self.export_presentation('.parquet', *SIZES_QUERY))
+
+        self.assertEqual(table.column_names, list(csv_rows[0].keys()))
+        self.assertEqual(table.num_rows, len(csv_rows))
+        for row, csv_row in zip(table.to_pylist(), csv_rows):
+            self.assertEqual(row['date'].isoformat(), csv_row['date'])
+            self.assertAlmostEqual(row['arts_tb'], float(csv_row['arts_tb']))
+            self.assertAlmostEqual(row['imaging_tb'], float(csv_row['imaging_tb']))
+
+    @unittest.skipIf(pa is None, 'pyarrow is not installed')
+    def test_arrow(self):
+        table = atdb_export.read_series(self.export_presentation('.arrow', *SPEED_QUERY))
+
+        self.assertEqual(table.schema.names, ['taskid', 'type', 'timestamp', 'timestamp_end', 'duration', 'speed_bps'])
+        self.assertEqual(table.schema.field('taskid').type, pa.string())
+        self.assertTrue(pa.types.is_timestamp(table.schema.field('timestamp').type))
+        self.assertTrue(pa.types.is_timestamp(table.schema.field('timestamp_end').type))
+        self.assertEqual(table.schema.field('duration').type, pa.int64())
+        self.assertEqual(table.schema.field('speed_bps').type, pa.float64())
+
+        self.assertTrue(table.schema.field('duration').nullable)
+        self.assertTrue(table.schema.field('speed_bps').nullable)
+        self.assertEqual(table.column('duration').null_count, 3)
+        self.assertEqual(table.column('speed_bps').null_count, 1)
+        self.assertEqual(table.column('timestamp_end').null_count, 1)
+
+        rows = table.to_pylist()
+        self.assertEqual(rows[0]['timestamp'], datetime.datetime(2019, 3, 17, 16, 0))
+        self.assertEqual(rows[0]['timestamp_end'], datetime.datetime(2019, 3, 17, 20, 0))
+        self.assertAlmostEqual(rows[0]['speed_bps'], 245.1 * 8 / 1000)
+
+    @unittest.skipIf(pa is None, 'pyarrow is not installed')
+    def test_arrow_and_feather_are_the_same(self):
+        arrow = atdb_export.read_series(self.export_presentation('.arrow', *SIZES_QUERY))
+        feather = atdb_export.read_series(self.export_presentation('.feather', *SIZES_QUERY))
+        self.assertTrue(arrow.equals(feather))
+
+
+if __name__ == '__main__':
+    unittest.main()
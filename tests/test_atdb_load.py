@@ -0,0 +1,98 @@
+"""
+    Checks of the concurrent load sweep and the peak windows of the ingest_load presentation
+    Run with: python -m pytest tests
+"""
+
+import os
+import sys
+import datetime
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import atdb_stats
+
+
+def t(hour):
+    return datetime.datetime(2019, 3, 11) + datetime.timedelta(hours=hour)
+
+
+def datapoint(start, end, speed_bps, type='ingesting'):
+    return {'type': type, 'timestamp': t(start), 'timestamp_end': t(end), 'speed_bps': speed_bps}
+
+
+class TestConcurrentLoad(unittest.TestCase):
+
+    def test_overlapping_intervals(self):
+        timestamps, bandwidth, concurrency = atdb_stats.compute_concurrent_load(
+            [datapoint(0, 4, 1.0), datapoint(2, 6, 2.0), datapoint(3, 5, 4.0, type='observing')])
+
+        self.assertEqual(timestamps, [t(0), t(2), t(3), t(4), t(5), t(6)])
+        self.assertEqual(bandwidth, [1.0, 3.0, 7.0, 6.0, 2.0, 0.0])
+        self.assertEqual(concurrency, [1, 2, 3, 2, 1, 0])
+
+    def test_types(self):
+        timestamps, bandwidth, concurrency = atdb_stats.compute_concurrent_load(
+            [datapoint(0, 4, 1.0), datapoint(3, 5, 4.0, type='observing'), datapoint(1, 2, 8.0, type='ingest_error')],
+            types=('ingesting',))
+
+        self.assertEqual(timestamps, [t(0), t(4)])
+        self.assertEqual(bandwidth, [1.0, 0.0])
+
+    def test_end_before_start_on_equal_timestamps(self):
+        # back to back tasks never count as concurrent
+        timestamps, bandwidth, concurrency = atdb_stats.compute_concurrent_load(
+            [datapoint(2, 4, 2.0), datapoint(0, 2, 1.0)])
+
+        self.assertEqual(timestamps, [t(0), t(2), t(4)])
+        self.assertEqual(bandwidth, [1.0, 2.0, 0.0])
+        self.assertEqual(concurrency, [1, 1, 0])
+        self.assertEqual(max(concurrency), 1)
+
+    def test_several_events_on_one_timestamp(self):
+        timestamps, bandwidth, concurrency = atdb_stats.compute_concurrent_load(
+            [datapoint(0, 3, 1.0), datapoint(1, 3, 2.0), datapoint(1, 2, 4.0), datapoint(3, 4, 8.0)])
+
+        self.assertEqual(timestamps, [t(0), t(1), t(2), t(3), t(4)])
+        self.assertEqual(bandwidth, [1.0, 7.0, 3.0, 8.0, 0.0])
+        self.assertEqual(concurrency, [1, 3, 2, 1, 0])
+
+    def test_datapoints_without_end_are_ignored(self):
+        open_datapoint = {'type': 'ingesting', 'timestamp': t(1), 'timestamp_end': None, 'speed_bps': 5.0}
+        timestamps, bandwidth, concurrency = atdb_stats.compute_concurrent_load([datapoint(0, 2, 1.0), open_datapoint])
+
+        self.assertEqual(bandwidth, [1.0, 0.0])
+
+
+class TestPeakWindows(unittest.TestCase):
+
+    def test_adjacent_steps_are_merged(self):
+        timestamps = [t(0), t(1), t(2), t(3), t(4), t(5), t(6)]
+        bandwidth = [1.0, 9.5, 10.0, 9.0, 2.0, 9.8, 0.0]
+        concurrency = [1, 3, 4, 3, 1, 2, 0]
+
+        windows = atdb_stats.find_peak_windows(timestamps, bandwidth, concurrency, peak_fraction=0.9)
+
+        self.assertEqual(windows, [
+            {'start': t(1), 'end': t(4), 'max_bandwidth': 10.0, 'max_concurrency': 4},
+            {'start': t(5), 'end': t(6), 'max_bandwidth': 9.8, 'max_concurrency': 2}])
+
+    def test_float_residue_after_the_last_task_is_no_peak(self):
+        # 0.1 + 0.2 - 0.1 - 0.2 leaves about 3e-17
+        timestamps, bandwidth, concurrency = atdb_stats.compute_concurrent_load(
+            [datapoint(0, 2, 0.1), datapoint(1, 3, 0.2), datapoint(4, 5, 0.0)])
+        self.assertNotEqual(bandwidth[3], 0)
+        self.assertEqual(concurrency[3], 0)
+
+        windows = atdb_stats.find_peak_windows(timestamps, bandwidth, concurrency, peak_fraction=0)
+
+        self.assertEqual(windows, [{'start': t(0), 'end': t(3), 'max_bandwidth': bandwidth[1], 'max_concurrency': 2},
+                                   {'start': t(4), 'end': t(5), 'max_bandwidth': bandwidth[4], 'max_concurrency': 1}])
+
+    def test_no_datapoints(self):
+        self.assertEqual(atdb_stats.find_peak_windows([], [], []), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
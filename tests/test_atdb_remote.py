@@ -0,0 +1,128 @@
+"""
+    Checks of the remote transfers, the round trip needs a localhost sshd with ssh keys and is skipped otherwise.
+    Run with: python -m pytest tests
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from atdb_statistics import atdb_remote
+
+
+def localhost_available():
+    if shutil.which('ssh') is None or shutil.which('scp') is None:
+        return False
+    try:
+        return subprocess.run(['ssh', '-o', 'BatchMode=yes', '-o', 'ConnectTimeout=3', 'localhost', 'true'],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10).returncode == 0
+    except subprocess.TimeoutExpired:
+        return False
+
+
+class TestRemoteHost(unittest.TestCase):
+
+    def setUp(self):
+        self.local_dir = tempfile.mkdtemp()
+        self.remote_host = atdb_remote.RemoteHost('localhost')
+
+        # the transfers are recorded instead of done
+        self.copied = []
+        self.remote_host.connect = lambda: None
+        self.remote_host.get = lambda source, target: self.copied.append(source) or 0
+
+    def tearDown(self):
+        self.remote_host.close()
+        shutil.rmtree(self.local_dir)
+
+    def write_local_file(self, name, content, mtime):
+        filename = os.path.join(self.local_dir, name)
+        with open(filename, 'w') as f:
+            f.write(content)
+        os.utime(filename, (mtime, mtime))
+        return filename
+
+    def test_get_files_skips_unchanged_files(self):
+        unchanged = self.write_local_file('unchanged.csv', '12345', 1552262400)
+        other_size = self.write_local_file('other_size.csv', '123', 1552262400)
+        other_mtime = self.write_local_file('other_mtime.csv', '12345', 1552262400)
+        missing = os.path.join(self.local_dir, 'missing.csv')
+        unlisted = self.write_local_file('unlisted.csv', '12345', 1552262400)
+
+        remote_files = {'/data/unchanged.csv': (5, 1552262400),
+                        '/data/other_size.csv': (5, 1552262400),
+                        '/data/other_mtime.csv': (5, 1552266000),
+                        '/data/missing.csv': (5, 1552262400)}
+        transfers = [('/data/unchanged.csv', unchanged),
+                     ('/data/other_size.csv', other_size),
+                     ('/data/other_mtime.csv', other_mtime),
+                     ('/data/missing.csv', missing),
+                     ('/data/unlisted.csv', unlisted)]
+
+        copied_targets = self.remote_host.get_files(transfers, remote_files)
+
+        self.assertEqual(sorted(self.copied), ['/data/missing.csv', '/data/other_mtime.csv',
+                                               '/data/other_size.csv', '/data/unlisted.csv'])
+        self.assertNotIn(unchanged, copied_targets)
+
+    def test_get_files_raises_on_failed_transfer(self):
+        self.remote_host.get = lambda source, target: 1
+        with self.assertRaises(Exception):
+            self.remote_host.get_files([('/data/a.csv', os.path.join(self.local_dir, 'a.csv'))])
+
+    def test_list_files_parses_find_output(self):
+        output = ('1024 1552262400.1234567890 /data/arts/ARTS190311.csv\n'
+                  '0 1552266000.0000000000 /data/arts/empty file.csv\n')
+        completed = subprocess.CompletedProcess(args=[], returncode=0, stdout=output)
+
+        with mock.patch.object(atdb_remote.subprocess, 'run', return_value=completed) as run:
+            files = self.remote_host.list_files('/data/arts')
+
+        self.assertEqual(files, {'/data/arts/ARTS190311.csv': (1024, 1552262400),
+                                 '/data/arts/empty file.csv': (0, 1552266000)})
+
+        # a single remote command over the shared connection
+        self.assertEqual(run.call_count, 1)
+        command = run.call_args[0][0]
+        self.assertIn('ControlMaster=auto', command)
+        self.assertIn("find /data/arts -maxdepth 1 -type f -printf '%s %T@ %p\\n'", command[-1])
+
+
+@unittest.skipUnless(localhost_available(), 'no sshd with ssh keys on localhost')
+class TestLocalhostRoundTrip(unittest.TestCase):
+
+    def setUp(self):
+        self.remote_dir = tempfile.mkdtemp()
+        self.local_dir = tempfile.mkdtemp()
+        self.remote_host = atdb_remote.RemoteHost('localhost', workers=2)
+
+    def tearDown(self):
+        self.remote_host.close()
+        shutil.rmtree(self.remote_dir)
+        shutil.rmtree(self.local_dir)
+
+    def test_get_dir(self):
+        for i in range(3):
+            with open(os.path.join(self.remote_dir, 'ARTS19031' + str(i) + '.csv'), 'w') as f:
+                f.write('taskID,size\n' * (i + 1))
+
+        copied = self.remote_host.get_dir(self.remote_dir, self.local_dir)
+        self.assertEqual(len(copied), 3)
+        for filename in copied:
+            with open(filename) as f, open(os.path.join(self.remote_dir, os.path.basename(filename))) as g:
+                self.assertEqual(f.read(), g.read())
+
+        # the second time nothing has changed
+        self.assertEqual(self.remote_host.get_dir(self.remote_dir, self.local_dir), [])
+        self.assertEqual(self.remote_host.execute('test -d ' + self.remote_dir), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+"""
+    Checks of the quantile sketches of the ingest_statistics presentation
+    Run with: python -m pytest tests
+"""
+
+import os
+import sys
+import random
+import shutil
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from atdb_statistics import atdb_sketch
+
+PERCENTILES = [0.50, 0.95, 0.99]
+
+
+def lognormal_values(count, seed):
+    generator = random.Random(seed)
+    return [generator.lognormvariate(0, 1) for i in range(count)]
+
+
+class TestQuantileSketch(unittest.TestCase):
+
+    def setUp(self):
+        self.values = lognormal_values(100000, seed=11)
+        self.sketch = atdb_sketch.QuantileSketch(0.01)
+        for value in self.values:
+            self.sketch.add(value)
+
+    def test_relative_accuracy(self):
+        sorted_values = sorted(self.values)
+        for q in PERCENTILES:
+            exact = sorted_values[int(q * (len(sorted_values) - 1))]
+            self.assertLessEqual(abs(self.sketch.quantile(q) - exact) / exact, 0.01, 'p' + str(int(q * 100)))
+
+        self.assertEqual(self.sketch.count, len(self.values))
+        self.assertAlmostEqual(self.sketch.mean(), sum(self.values) / len(self.values))
+
+    def test_merged_sketch_equals_single_sketch(self):
+        merged = atdb_sketch.QuantileSketch(0.01)
+        for i in range(0, len(self.values), 25000):
+            part = atdb_sketch.QuantileSketch(0.01)
+            for value in self.values[i:i + 25000]:
+                part.add(value)
+            merged.merge(part)
+
+        self.assertEqual(merged.buckets, self.sketch.buckets)
+        self.assertEqual(merged.count, self.sketch.count)
+        self.assertEqual((merged.min, merged.max), (self.sketch.min, self.sketch.max))
+        for q in PERCENTILES:
+            self.assertEqual(merged.quantile(q), self.sketch.quantile(q))
+
+    def test_merge_with_other_accuracy(self):
+        with self.assertRaises(Exception):
+            self.sketch.merge(atdb_sketch.QuantileSketch(0.02))
+
+    def test_zero_values_and_empty_sketch(self):
+        sketch = atdb_sketch.QuantileSketch()
+        self.assertIsNone(sketch.quantile(0.5))
+
+        for value in [0, 0, 0, 5.0, None]:
+            sketch.add(value)
+        self.assertEqual(sketch.count, 4)
+        self.assertEqual(sketch.quantile(0.5), 0)
+        self.assertAlmostEqual(sketch.quantile(1), 5.0)
+        self.assertEqual(sketch.histogram()[0], (0, 0, 3))
+
+    def test_histogram(self):
+        bins = self.sketch.histogram()
+        self.assertEqual(sum([bin[2] for bin in bins]), self.sketch.count)
+        for lower, upper, count in bins:
+            self.assertLess(lower, upper)
+            self.assertAlmostEqual(upper / lower, self.sketch.gamma)
+
+
+class TestSaveSketches(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.output_dir, 'sketches.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_round_trip(self):
+        sketches = {}
+        for value in lognormal_values(1000, seed=1):
+            atdb_sketch.add_to_sketches(sketches, ('2019-03-11', 'ingesting'), 'speed', value)
+            atdb_sketch.add_to_sketches(sketches, ('2019-03-11', 'ingesting'), 'duration', value * 3600)
+        atdb_sketch.add_to_sketches(sketches, ('2019-03-12', 'observing'), 'speed', 0)
+
+        atdb_sketch.save_sketches(self.filename, sketches)
+        loaded = atdb_sketch.load_sketches(self.filename)
+
+        self.assertEqual(sorted(loaded), sorted(sketches))
+        for key in sketches:
+            for name in sketches[key]:
+                self.assertEqual(loaded[key][name].to_dict(), sketches[key][name].to_dict())
+                for q in PERCENTILES:
+                    self.assertEqual(loaded[key][name].quantile(q), sketches[key][name].quantile(q))
+
+    def test_merge_with_saved_sketches(self):
+        first = {}
+        second = {}
+        for value in lognormal_values(1000, seed=1):
+            atdb_sketch.add_to_sketches(first, ('2019-03-11', 'ingesting'), 'speed', value)
+        for value in lognormal_values(1000, seed=2):
+            atdb_sketch.add_to_sketches(second, ('2019-03-11', 'ingesting'), 'speed', value)
+            atdb_sketch.add_to_sketches(second, ('2019-03-12', 'ingesting'), 'speed', value)
+
+        atdb_sketch.save_sketches(self.filename, first)
+        merged = atdb_sketch.merge_sketches(atdb_sketch.load_sketches(self.filename), second)
+
+        self.assertEqual(merged[('2019-03-11', 'ingesting')]['speed'].count, 2000)
+        self.assertEqual(merged[('2019-03-12', 'ingesting')]['speed'].count, 1000)
+
+    def test_missing_file(self):
+        self.assertEqual(atdb_sketch.load_sketches(self.filename), {})
+
+    def test_merge_saved_sketches_with_other_accuracy(self):
+        sketches = {}
+        atdb_sketch.add_to_sketches(sketches, ('2019-03-11', 'ingesting'), 'speed', 1.0, relative_accuracy=0.01)
+        atdb_sketch.save_sketches(self.filename, sketches)
+
+        other = {}
+        atdb_sketch.add_to_sketches(other, ('2019-03-11', 'ingesting'), 'speed', 1.0, relative_accuracy=0.05)
+        with self.assertRaises(Exception):
+            atdb_sketch.merge_sketches(atdb_sketch.load_sketches(self.filename), other)
+
+
+if __name__ == '__main__':
+    unittest.main()